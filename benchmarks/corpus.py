@@ -0,0 +1,89 @@
+"""
+Synthetic subdomain corpora for the benchmarks.
+
+Names are derived from their index, and whether a name resolves or is alive
+is derived from its hash. This lets the DNS and HTTP stand-ins answer for
+corpora of millions of names without keeping any of them in memory.
+"""
+
+import json
+import zlib
+
+WORDS = [
+    "www", "mail", "api", "dev", "staging", "admin", "vpn", "portal", "cdn", "static",
+    "auth", "login", "test", "beta", "shop", "blog", "git", "ci", "grafana", "jira",
+]
+# Addresses a wildcard zone answers from
+WILDCARD_POOL_SIZE = 4
+
+
+class Corpus:
+    """
+    A deterministic set of subdomains spread over several zones.
+
+    Args:
+        size (int): Number of names in the corpus.
+        alive_ratio (float): Fraction of names that resolve and answer HTTP.
+        zone_count (int): Number of target zones the names are spread over.
+        wildcard_zones (int): Number of zones answering for any name, like wildcard DNS records.
+    """
+    def __init__(self, size, alive_ratio=0.3, zone_count=4, wildcard_zones=1):
+        self.size = size
+        self.alive_ratio = alive_ratio
+        self.zones = [f"zone{i}.bench.test" for i in range(zone_count)]
+        self.wildcard_zones = set(self.zones[:wildcard_zones])
+        # Some names resolve without serving anything, like parked or internal hosts
+        self.resolve_ratio = min(1.0, alive_ratio * 1.5)
+
+    def names(self, start=0, stop=None):
+        """
+        Yields the names of the corpus.
+        """
+        for i in range(start, self.size if stop is None else min(stop, self.size)):
+            yield f"{WORDS[i % len(WORDS)]}{i // len(WORDS)}.{self.zones[i % len(self.zones)]}"
+
+    def zone_of(self, name):
+        for zone in self.zones:
+            if name == zone or name.endswith(f".{zone}"):
+                return zone
+        return None
+
+    def _bucket(self, name):
+        return zlib.crc32(name.encode()) % 10000 / 10000
+
+    def resolves(self, name):
+        zone = self.zone_of(name)
+        if zone is None:
+            return False
+        return zone in self.wildcard_zones or self._bucket(name) < self.resolve_ratio
+
+    def is_alive(self, name):
+        zone = self.zone_of(name)
+        if zone is None:
+            return False
+        return zone in self.wildcard_zones or self._bucket(name) < self.alive_ratio
+
+    def ips(self, name):
+        """
+        Returns the addresses of the name. Wildcard zones answer every name from
+        the same pool of addresses, like CDNs and load balancers.
+        """
+        if self.zone_of(name) in self.wildcard_zones:
+            return [self._address(f"{self.zone_of(name)}#{i}") for i in range(WILDCARD_POOL_SIZE)]
+        return [self._address(name)]
+
+    def _address(self, key):
+        value = zlib.crc32(key.encode())
+        return f"10.{(value >> 16) & 0xff}.{(value >> 8) & 0xff}.{value & 0xff}"
+
+    def subfinder_lines(self, start=0, stop=None):
+        """
+        Yields the names as subfinder -oJ output lines.
+        """
+        for name in self.names(start, stop):
+            yield json.dumps({"host": name, "input": self.zone_of(name), "source": "bench"})
+
+    def write_ndjson(self, path):
+        with open(path, "w") as outfile:
+            for line in self.subfinder_lines():
+                outfile.write(line + "\n")
@@ -0,0 +1,83 @@
+"""
+Recorded CloudWatch Logs pages for benchmarking log ingestion.
+
+record_pages() writes describe_log_streams and get_log_events responses as
+JSON files, RecordedLogsClient replays them with the same paging tokens as
+the logs client, so CloudWatchLogSource can be run against them unchanged.
+Like the real API, streams contain empty pages before their last page.
+"""
+
+from datetime import datetime
+import json
+import os
+
+# get_log_events returns at most 10,000 events per page
+PAGE_SIZE = 10000
+
+
+def record_pages(corpus, directory, streams=4, page_size=PAGE_SIZE):
+    """
+    Writes the corpus as CloudWatch-style event pages split over several log streams.
+
+    Args:
+        corpus (Corpus): The corpus to record.
+        directory (str): Directory the pages are written to.
+        streams (int): Number of log streams, one per tool run.
+        page_size (int): Number of events per page.
+    """
+    os.makedirs(directory, exist_ok=True)
+    now = int(datetime.now().timestamp() * 1000)
+    stream_names = [f"subfinder/subfinder/bench{i}" for i in range(streams)]
+    per_stream = -(-corpus.size // streams)
+    for index, stream_name in enumerate(stream_names):
+        start = index * per_stream
+        stop = min(corpus.size, start + per_stream)
+        lines = corpus.subfinder_lines(start, stop)
+        page_count = max(1, -(-(stop - start) // page_size))
+        # Every other stream starts with an empty page and data pages are separated by empty ones
+        pages = [[]] if index % 2 else []
+        for page in range(page_count):
+            if page:
+                pages.append([])
+            pages.append([
+                {"timestamp": now, "message": line, "ingestionTime": now}
+                for _, line in zip(range(page_size), lines)
+            ])
+        for page, events in enumerate(pages):
+            response = {
+                "events": events,
+                "nextForwardToken": f"f/{index}/{page + 1}",
+                "nextBackwardToken": f"b/{index}/{page}",
+            }
+            with open(os.path.join(directory, f"events_{index}_{page}.json"), "w") as outfile:
+                json.dump(response, outfile)
+    with open(os.path.join(directory, "log_streams.json"), "w") as outfile:
+        json.dump({"logStreams": [
+            {"logStreamName": name, "lastEventTimestamp": now} for name in stream_names
+        ]}, outfile)
+
+
+class RecordedLogsClient:
+    """
+    Replays recorded pages with the subset of the boto3 logs client API used by CloudWatchLogSource.
+    """
+    def __init__(self, directory):
+        self.directory = directory
+        with open(os.path.join(directory, "log_streams.json")) as infile:
+            self.log_streams = json.load(infile)
+        self.stream_index = {
+            stream["logStreamName"]: index for index, stream in enumerate(self.log_streams["logStreams"])
+        }
+
+    def describe_log_streams(self, **kwargs):
+        return self.log_streams
+
+    def get_log_events(self, logStreamName, nextToken=None, **kwargs):
+        index = self.stream_index[logStreamName]
+        page = int(nextToken.split("/")[-1]) if nextToken else 0
+        path = os.path.join(self.directory, f"events_{index}_{page}.json")
+        # The real API returns no events and the same token past the last page
+        if not os.path.exists(path):
+            return {"events": [], "nextForwardToken": nextToken, "nextBackwardToken": f"b/{index}/{page}"}
+        with open(path) as infile:
+            return json.load(infile)
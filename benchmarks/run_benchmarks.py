@@ -0,0 +1,270 @@
+"""
+Benchmarks the pipeline stages against synthetic corpora and local stand-ins.
+
+Reports throughput, p50/p99 latency and peak memory for get_domains,
+resolve_ips, check_if_alive, compare_domain_lists and discovery, and compares them
+with the stored baseline so regressions show up before deploying.
+
+Usage examples:
+
+# Run with defaults and compare with baseline.json
+python3 benchmarks/run_benchmarks.py
+
+# Larger corpora, slower and lossier network, then store as new baseline
+python3 benchmarks/run_benchmarks.py --sizes 1000 100000 1000000 --dns-latency 0.02 --loss 0.05 --update-baseline
+"""
+
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+import contextlib
+import json
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+from unittest import mock
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(os.path.dirname(BENCH_DIR), "lambdas"))
+
+import backends
+import candidates
+import check_if_alive_lambda
+import compare_lambda
+import discovery_lambda
+from corpus import Corpus
+from recorded_logs import RecordedLogsClient, record_pages
+from standins import DnsStandIn, Faults, HttpStandIn, StandInResolver, generate_certificate
+
+BASELINE_PATH = os.path.join(BENCH_DIR, "baseline.json")
+# Options that change what is measured, results are only comparable when these match
+CONFIG_OPTIONS = [
+    "alive_ratio", "zones", "wildcard_zones", "probe_sample", "candidates", "dns_latency",
+    "http_latency", "timeout_ratio", "loss", "dns_timeout_hold", "http_timeout_hold",
+]
+
+
+def percentile(samples, fraction):
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+def measure(run):
+    """
+    Runs a stage once while tracing memory.
+
+    Args:
+        run (callable): Runs the stage and returns (items processed, latency samples in seconds).
+
+    Returns:
+        dict: Throughput in items/s, p50/p99 latency in ms and peak memory in MiB.
+    """
+    tracemalloc.start()
+    start = time.perf_counter()
+    items, latencies = run()
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {
+        "items": items,
+        "throughput": round(items / elapsed, 1) if elapsed else 0.0,
+        "p50_ms": round(percentile(latencies, 0.50) * 1000, 3),
+        "p99_ms": round(percentile(latencies, 0.99) * 1000, 3),
+        "peak_mib": round(peak / 2 ** 20, 2),
+    }
+
+
+def timed(func):
+    """
+    Wraps func so every call appends its duration to the returned list.
+    """
+    latencies = []
+
+    def wrapper(*args):
+        start = time.perf_counter()
+        try:
+            return func(*args)
+        finally:
+            latencies.append(time.perf_counter() - start)
+    return wrapper, latencies
+
+
+def bench_get_domains(corpus, work_dir, repeats=3):
+    pages_dir = os.path.join(work_dir, f"pages_{corpus.size}")
+    record_pages(corpus, pages_dir)
+    backends.configure(log_source=backends.CloudWatchLogSource(RecordedLogsClient(pages_dir)))
+
+    def run():
+        get_domains, latencies = timed(check_if_alive_lambda.get_domains)
+        for _ in range(repeats):
+            found = len(get_domains("/ecs/domain_enumerator"))
+        if found != corpus.size:
+            print(f"WARNING: get_domains found {found} of {corpus.size} names")
+        return corpus.size * repeats, latencies
+    return measure(run)
+
+
+def bench_probe_stage(func, corpus, sample):
+    """
+    Runs func over the first names of the corpus the way lambda_handler does.
+    """
+    def run():
+        probe, latencies = timed(func)
+        with ThreadPoolExecutor() as executor:
+            list(executor.map(probe, corpus.names(stop=sample)))
+        return len(latencies), latencies
+    return measure(run)
+
+
+def bench_discovery(corpus, limit):
+    """
+    Generates and resolves candidates for a wildcard and a regular zone, from 1% of the corpus as known names.
+    """
+    zones = [next(iter(corpus.wildcard_zones), corpus.zones[0]), corpus.zones[-1]]
+    known = set(corpus.names(stop=max(1, corpus.size // 100)))
+
+    def run():
+        resolve, latencies = timed(check_if_alive_lambda.resolve_all_ips)
+        with mock.patch.object(discovery_lambda, "resolve_all_ips", resolve):
+            found = discovery_lambda.discover(zones, known, candidates.DEFAULT_WORDS, limit)
+        wildcard_found = sum(1 for target, _ in found.values() if target in corpus.wildcard_zones)
+        if wildcard_found:
+            print(f"WARNING: {wildcard_found} wildcard answers were not filtered")
+        return len(latencies), latencies
+    return measure(run)
+
+
+def bench_compare(corpus, repeats=5):
+    # Previous day lost every 20th name and misses the newest 5% of the corpus
+    previous_list = [name for i, name in enumerate(corpus.names(stop=int(corpus.size * 0.95))) if i % 20]
+    current_list = list(corpus.names())
+    backends.configure(alert_queue=backends.InProcessAlertQueue(lambda data: None))
+
+    def run():
+        compare, latencies = timed(compare_lambda.compare_domain_lists)
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+            for _ in range(repeats):
+                compare(previous_list, current_list)
+        return corpus.size * repeats, latencies
+    return measure(run)
+
+
+def run_benchmarks(args):
+    results = {}
+    with tempfile.TemporaryDirectory() as work_dir:
+        for size in args.sizes:
+            corpus = Corpus(size, args.alive_ratio, args.zones, args.wildcard_zones)
+            dns = DnsStandIn(corpus, Faults(args.dns_latency, args.timeout_ratio, args.loss, args.dns_timeout_hold)).start()
+            certificate = generate_certificate(corpus.zones, work_dir)
+            http = HttpStandIn(
+                corpus,
+                Faults(args.http_latency, args.timeout_ratio, args.loss, args.http_timeout_hold),
+                certificate
+            ).start()
+            resolver = StandInResolver(dns.address)
+            environment = {
+                "HTTP_PROXY": http.proxy_url,
+                "HTTPS_PROXY": http.proxy_url,
+                "NO_PROXY": "",
+            }
+            # Without a certificate HTTPS tunnels are refused and probes fall back to HTTP
+            if certificate:
+                environment["REQUESTS_CA_BUNDLE"] = certificate[0]
+            sample = min(size, args.probe_sample)
+            try:
+                with mock.patch.dict(os.environ, environment), \
+                        mock.patch("socket.gethostbyname", resolver.gethostbyname), \
+                        mock.patch("socket.gethostbyname_ex", resolver.gethostbyname_ex):
+                    results[f"get_domains@{size}"] = bench_get_domains(corpus, work_dir)
+                    results[f"resolve_ips@{size}"] = bench_probe_stage(check_if_alive_lambda.resolve_ips, corpus, sample)
+                    results[f"check_if_alive@{size}"] = bench_probe_stage(check_if_alive_lambda.check_if_alive, corpus, sample)
+                    results[f"compare_domain_lists@{size}"] = bench_compare(corpus)
+                    results[f"discovery@{size}"] = bench_discovery(corpus, args.candidates)
+            finally:
+                dns.stop()
+                http.stop()
+                backends.configure()
+            for key in (k for k in results if k.endswith(f"@{size}")):
+                print_result(key, results[key])
+    return results
+
+
+def print_result(key, result):
+    print(f"{key:<32} {result['items']:>9} items {result['throughput']:>12} items/s "
+          f"p50 {result['p50_ms']:>10} ms p99 {result['p99_ms']:>10} ms peak {result['peak_mib']:>8} MiB")
+
+
+def compare_with_baseline(results, baseline, tolerance, latency_slack_ms):
+    """
+    Compares results with the baseline. Latencies also get an absolute slack,
+    as a few ms of scheduling jitter is larger than the tolerance for fast stages.
+
+    Returns:
+        list: Descriptions of the metrics that regressed by more than the tolerance.
+    """
+    regressions = []
+    for key, result in results.items():
+        if key not in baseline or key.startswith("_"):
+            continue
+        expected = baseline[key]
+        if result["throughput"] < expected["throughput"] * (1 - tolerance):
+            regressions.append(f"{key} throughput {result['throughput']} < baseline {expected['throughput']}")
+        if result["p99_ms"] > expected["p99_ms"] * (1 + tolerance) + latency_slack_ms:
+            regressions.append(f"{key} p99_ms {result['p99_ms']} > baseline {expected['p99_ms']}")
+        if result["peak_mib"] > expected["peak_mib"] * (1 + tolerance):
+            regressions.append(f"{key} peak_mib {result['peak_mib']} > baseline {expected['peak_mib']}")
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the pipeline stages against synthetic corpora and local DNS/HTTP stand-ins.")
+    parser.add_argument("--sizes", help="Corpus sizes to run (1k to 1M names)", type=int, nargs='+', default=[1000, 10000, 100000])
+    parser.add_argument("--alive-ratio", help="Fraction of names that are alive", type=float, default=0.3)
+    parser.add_argument("--zones", help="Number of target zones", type=int, default=4)
+    parser.add_argument("--wildcard-zones", help="Number of zones with wildcard DNS", type=int, default=1)
+    parser.add_argument("--probe-sample", help="Max names sent through DNS/HTTP stages per corpus", type=int, default=1000)
+    parser.add_argument("--candidates", help="Max discovery candidates per zone", type=int, default=10000)
+    parser.add_argument("--dns-latency", help="Seconds added to every DNS answer", type=float, default=0.005)
+    parser.add_argument("--http-latency", help="Seconds added to every HTTP answer", type=float, default=0.01)
+    parser.add_argument("--timeout-ratio", help="Fraction of DNS/HTTP requests that time out", type=float, default=0.001)
+    parser.add_argument("--loss", help="Fraction of DNS/HTTP requests that are dropped", type=float, default=0.005)
+    parser.add_argument("--dns-timeout-hold", help="Seconds a timed out DNS request is held", type=float, default=2.0)
+    parser.add_argument("--http-timeout-hold", help="Seconds a timed out HTTP request is held", type=float, default=4.0)
+    parser.add_argument("--tolerance", help="Allowed relative regression against the baseline", type=float, default=0.25)
+    parser.add_argument("--latency-slack-ms", help="Absolute p99 slack in ms on top of the tolerance", type=float, default=20.0)
+    parser.add_argument("--baseline", help="Baseline file", default=BASELINE_PATH)
+    parser.add_argument("--update-baseline", help="Store the results as the new baseline", action='store_true')
+    args = parser.parse_args()
+
+    results = run_benchmarks(args)
+    config = {option: getattr(args, option) for option in CONFIG_OPTIONS}
+
+    if args.update_baseline:
+        baseline = {}
+        if os.path.isfile(args.baseline):
+            with open(args.baseline) as infile:
+                baseline = json.load(infile)
+            if baseline.get("_config") != config:
+                baseline = {}
+        baseline.update(results)
+        baseline["_config"] = config
+        with open(args.baseline, "w") as outfile:
+            json.dump(baseline, outfile, indent=2, sort_keys=True)
+        print(f"INFO: baseline stored in {args.baseline}")
+    elif os.path.isfile(args.baseline):
+        with open(args.baseline) as infile:
+            baseline = json.load(infile)
+        if baseline.get("_config") != config:
+            print("INFO: options differ from the baseline, results are not compared")
+            sys.exit(0)
+        regressions = compare_with_baseline(results, baseline, args.tolerance, args.latency_slack_ms)
+        for regression in regressions:
+            print(f"REGRESSION: {regression}")
+        if regressions:
+            sys.exit(1)
+        print("INFO: no regressions against baseline")
+    else:
+        print("INFO: no baseline found, run with --update-baseline to store one")
@@ -0,0 +1,254 @@
+"""
+Local stand-ins for DNS and HTTP(S) used by the benchmarks.
+
+Both answer from a Corpus and can inject latency, timeouts and packet loss.
+The HTTP stand-in is a forward proxy, so requests made by the lambdas reach it
+through the HTTP_PROXY/HTTPS_PROXY environment variables and HTTPS is served
+with a self-signed certificate covering the corpus zones.
+"""
+
+import itertools
+import os
+import random
+import socket
+import socketserver
+import ssl
+import struct
+import subprocess
+import threading
+import time
+
+
+class Faults:
+    """
+    Fault injection settings shared by the stand-ins.
+
+    Args:
+        latency (float): Seconds added before every answer.
+        timeout_ratio (float): Fraction of requests held for timeout_hold seconds and never answered.
+        loss_ratio (float): Fraction of requests dropped without an answer.
+        timeout_hold (float): Seconds a timed out request is held for.
+        seed (int): Seed of the fault rolls, so runs inject the same number of faults.
+    """
+    def __init__(self, latency=0.0, timeout_ratio=0.0, loss_ratio=0.0, timeout_hold=5.0, seed=0):
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.latency = latency
+        self.timeout_ratio = timeout_ratio
+        self.loss_ratio = loss_ratio
+        self.timeout_hold = timeout_hold
+
+    def apply(self):
+        """
+        Sleeps for the injected latency.
+
+        Returns:
+            bool: False if the request should not be answered.
+        """
+        with self.lock:
+            roll = self.random.random()
+        if roll < self.loss_ratio:
+            return False
+        if roll < self.loss_ratio + self.timeout_ratio:
+            time.sleep(self.timeout_hold)
+            return False
+        if self.latency:
+            time.sleep(self.latency)
+        return True
+
+
+class _UdpServer(socketserver.ThreadingUDPServer):
+    daemon_threads = True
+
+
+class _TcpServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+    request_queue_size = 128
+
+
+class _Server:
+    """
+    Runs a socketserver in a daemon thread on a free local port.
+    """
+    def start(self):
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    @property
+    def address(self):
+        return self.server.server_address
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+########## DNS ##########
+
+def _read_qname(data, offset):
+    labels = []
+    while data[offset]:
+        length = data[offset]
+        labels.append(data[offset + 1:offset + 1 + length].decode())
+        offset += length + 1
+    return ".".join(labels), offset + 1
+
+
+class DnsStandIn(_Server):
+    """
+    UDP DNS server answering A queries for names of the corpus that resolve, NXDOMAIN otherwise.
+    Names with several addresses get all of them, rotated on every answer like round robin DNS.
+    """
+    def __init__(self, corpus, faults=None):
+        stand_in = self
+        self.corpus = corpus
+        self.faults = faults or Faults()
+        self.rotation = itertools.count()
+
+        class Handler(socketserver.BaseRequestHandler):
+            def handle(self):
+                data, sock = self.request
+                if stand_in.faults.apply():
+                    sock.sendto(stand_in.answer(data), self.client_address)
+
+        self.server = _UdpServer(("127.0.0.1", 0), Handler)
+
+    def answer(self, query):
+        name, end = _read_qname(query, 12)
+        question = query[12:end + 4]
+        if self.corpus.resolves(name):
+            ips = self.corpus.ips(name)
+            shift = next(self.rotation) % len(ips)
+            header = struct.pack(">2sHHHHH", query[:2], 0x8180, 1, len(ips), 0, 0)
+            records = b"".join(
+                struct.pack(">HHHIH", 0xc00c, 1, 1, 60, 4) + socket.inet_aton(ip)
+                for ip in ips[shift:] + ips[:shift]
+            )
+            return header + question + records
+        return struct.pack(">2sHHHHH", query[:2], 0x8183, 1, 0, 0, 0) + question
+
+
+class StandInResolver:
+    """
+    Minimal DNS client used in place of socket.gethostbyname and socket.gethostbyname_ex,
+    raising the same exceptions.
+    """
+    def __init__(self, address, timeout=1.0):
+        self.address = address
+        self.timeout = timeout
+
+    def gethostbyname(self, name):
+        return self.gethostbyname_ex(name)[2][0]
+
+    def gethostbyname_ex(self, name):
+        query_id = random.getrandbits(16)
+        qname = b"".join(bytes([len(label)]) + label.encode() for label in name.split(".")) + b"\0"
+        query = struct.pack(">HHHHHH", query_id, 0x0100, 1, 0, 0, 0) + qname + struct.pack(">HH", 1, 1)
+        with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+            sock.settimeout(self.timeout)
+            sock.sendto(query, self.address)
+            while True:
+                response, _ = sock.recvfrom(512)
+                if struct.unpack(">H", response[:2])[0] == query_id:
+                    break
+        flags, _, answers = struct.unpack(">HHH", response[2:8])
+        if flags & 0xf or not answers:
+            raise socket.gaierror(socket.EAI_NONAME, "Name or service not known")
+        # Answers are fixed size A records with a compressed name, at the end of the response
+        records = response[-16 * answers:]
+        return name, [], [socket.inet_ntoa(records[offset + 12:offset + 16]) for offset in range(0, len(records), 16)]
+
+
+########## HTTP(S) ##########
+
+def generate_certificate(zones, directory):
+    """
+    Generates a self-signed certificate for the wildcards of the zones with openssl.
+
+    Returns:
+        tuple: Paths of the certificate and key, or None if openssl is not available.
+    """
+    cert_path = os.path.join(directory, "standin.crt")
+    key_path = os.path.join(directory, "standin.key")
+    alt_names = ",".join(f"DNS:*.{zone}" for zone in zones)
+    try:
+        subprocess.run(
+            ["openssl", "req", "-x509", "-newkey", "rsa:2048", "-nodes", "-days", "1",
+             "-keyout", key_path, "-out", cert_path, "-subj", "/CN=bench.test",
+             "-addext", f"subjectAltName={alt_names}"],
+            check=True, capture_output=True
+        )
+    except (OSError, subprocess.CalledProcessError) as err:
+        print(f"WARNING: could not generate certificate, HTTPS stand-in disabled: {err}")
+        return None
+    return cert_path, key_path
+
+
+class HttpStandIn(_Server):
+    """
+    Forward proxy answering for alive names of the corpus. Plain HTTP requests are
+    answered directly, CONNECT tunnels are terminated with TLS when a certificate is given.
+    Connections for names that are not alive are closed, like a refused connection.
+    """
+    def __init__(self, corpus, faults=None, certificate=None, body_size=2048):
+        stand_in = self
+        self.corpus = corpus
+        self.faults = faults or Faults()
+        self.body_size = body_size
+        self.tls_context = None
+        if certificate:
+            self.tls_context = ssl.create_default_context(ssl.Purpose.CLIENT_AUTH)
+            self.tls_context.load_cert_chain(*certificate)
+
+        class Handler(socketserver.StreamRequestHandler):
+            def handle(self):
+                stand_in.handle(self.connection, self.rfile)
+
+        self.server = _TcpServer(("127.0.0.1", 0), Handler)
+
+    @property
+    def proxy_url(self):
+        return f"http://{self.address[0]}:{self.address[1]}"
+
+    def _read_head(self, rfile):
+        request_line = rfile.readline().decode(errors="replace").split()
+        while rfile.readline() not in (b"\r\n", b"\n", b""):
+            pass
+        return request_line
+
+    def _response(self, method, host):
+        body = (f"<html><head><title>{host}</title></head><body>"
+                .ljust(self.body_size, "x") + "</body></html>").encode()
+        head = (
+            "HTTP/1.1 200 OK\r\n"
+            "Server: standin\r\n"
+            "Content-Type: text/html\r\n"
+            f"Content-Length: {len(body)}\r\n"
+            "Connection: close\r\n\r\n"
+        ).encode()
+        return head if method == "HEAD" else head + body
+
+    def handle(self, connection, rfile):
+        request_line = self._read_head(rfile)
+        if len(request_line) < 2:
+            return
+        method, target = request_line[0], request_line[1]
+        if method == "CONNECT":
+            host = target.rsplit(":", 1)[0]
+            if not self.tls_context or not self.corpus.is_alive(host) or not self.faults.apply():
+                return
+            connection.sendall(b"HTTP/1.1 200 Connection established\r\n\r\n")
+            try:
+                with self.tls_context.wrap_socket(connection, server_side=True) as tls:
+                    tls_file = tls.makefile("rb")
+                    request_line = self._read_head(tls_file)
+                    if request_line:
+                        tls.sendall(self._response(request_line[0], host))
+            except (ssl.SSLError, OSError):
+                pass
+            return
+        host = target.split("://", 1)[-1].split("/", 1)[0].split(":", 1)[0]
+        if self.corpus.is_alive(host) and self.faults.apply():
+            connection.sendall(self._response(method, host))
@@ -157,7 +157,8 @@ class DomainEnumerator:
                 if file_exists:
                     response = s3.get_object(Bucket=bucket_name, Key=file_name)
                     content = response['Body'].read().decode()
-                    domains = content.splitlines()
+                    # Domains found by several runs of the day are repeated
+                    domains = set(content.splitlines())
                     alive_domains_count = len(domains)
                     
                     return creation_date, alive_domains_count
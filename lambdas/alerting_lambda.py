@@ -6,6 +6,7 @@ import requests
 import boto3
 from botocore.exceptions import ClientError
 import os
+import metrics
 
 # On every alert it will lookup, fix
 def lookup_topic_arn(topic_name):
@@ -41,11 +42,26 @@ def email_alert(message, topic_arn):
     try:
         sns = boto3.client("sns")        
         sns.publish(TopicArn=topic_arn, Message=message, Subject="Alert")
+        metrics.increment("alerts_sent")
         print("INFO Email sent")
     except ClientError as err:
+        metrics.increment("alert_failures")
         print(f"ERROR: error occurred while sending the email alert: {err}")
 
 
+def format_alert(data):
+    """
+    Formats the alert data as the text sent in notifications.
+
+    Args:
+        data (dict): The alert data containing action, message, and alert_type.
+
+    Returns:
+        str: The alert text.
+    """
+    return f'{data["action"]},{data["message"]}'
+
+
 def post_discord(url, data):
     """
     Posts the alert message to a Discord webhook URL.
@@ -55,12 +71,15 @@ def post_discord(url, data):
         data (dict): The alert data containing action, message, and alert_type.
     """
     webhook_message = {
-        "content": f'{data["action"]},{data["message"]}',
+        "content": format_alert(data),
     }
-    result = requests.post(url, json=webhook_message)
+    with metrics.timed("webhook_latency"):
+        result = requests.post(url, json=webhook_message)
     if 200 <= result.status_code < 300:
+        metrics.increment("alerts_sent")
         print(f"INFO sent {result.status_code}")
     else:
+        metrics.increment("alert_failures")
         print(f"ERROR not sent with {result.status_code}, response: {result.json()}")
 
 
@@ -68,14 +87,15 @@ def lambda_handler(event, context):
     """
     Lambda handler function to handle the incoming event.
     """
-    data = event
-    if data["alert_type"] == "email":
-        topic_arn = lookup_topic_arn("tf_shodanmore_email_notifcation")
-        email_alert(data["message"], topic_arn)
-    elif data["alert_type"] == "discord":
-        post_discord(os.environ['DC_WEBHOOK_URL'], data)
-    else:
-        print("ERROR: invalid alert_type")
+    with metrics.invocation("alerting_lambda", context):
+        data = event
+        if data["alert_type"] == "email":
+            topic_arn = lookup_topic_arn("tf_shodanmore_email_notifcation")
+            email_alert(data["message"], topic_arn)
+        elif data["alert_type"] == "discord":
+            post_discord(os.environ['DC_WEBHOOK_URL'], data)
+        else:
+            print("ERROR: invalid alert_type")
 
 #Test using this:
 #json_data = '{"action": "new", "message": ["dev.com", "secret.com"], "alert_type": "discord"}'
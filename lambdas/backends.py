@@ -0,0 +1,420 @@
+"""
+Storage, log source and alert queue backends shared by the lambdas.
+
+By default the lambdas talk to S3, CloudWatch Logs and the alerting lambda.
+The local runner calls configure() with filesystem and in-process backends
+so the whole pipeline can run without AWS.
+"""
+
+import boto3
+from botocore.exceptions import ClientError
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+import gzip
+import glob
+import io
+import json
+import os
+import re
+
+# S3 requires every multipart part except the last to be at least 5 MiB
+PART_SIZE = 8 * 1024 * 1024
+UPLOAD_WORKERS = 4
+
+_backends = {}
+
+
+def iter_stream_lines(stream, chunk_size=1024 * 1024):
+    """
+    Yields the decoded lines of a binary stream, reading it chunk by chunk.
+    """
+    remainder = b""
+    for chunk in iter(lambda: stream.read(chunk_size), b""):
+        lines = (remainder + chunk).split(b"\n")
+        remainder = lines.pop()
+        for line in lines:
+            yield line.decode()
+    if remainder:
+        yield remainder.decode()
+
+
+class S3LineWriter:
+    """
+    Streams lines into an S3 object, gzip compressed if compress is set. Data is
+    kept only until it fills a part, so small objects are sent with a single
+    put_object and large ones switch to a multipart upload whose parts
+    are uploaded in parallel on the shared executor.
+    """
+    def __init__(self, s3_client, bucket_name, key, executor, part_size=PART_SIZE, compress=True):
+        self.s3_client = s3_client
+        self.bucket_name = bucket_name
+        self.key = key
+        self.executor = executor
+        self.part_size = part_size
+        self.content_type = 'application/gzip' if compress else 'text/plain'
+        self.buffer = io.BytesIO()
+        self.stream = gzip.GzipFile(fileobj=self.buffer, mode='wb') if compress else self.buffer
+        self.upload_id = None
+        self.parts = []
+
+    def write(self, line):
+        self.stream.write(f"{line}\n".encode())
+        if self.buffer.tell() >= self.part_size:
+            try:
+                self._upload_part(self._take_chunk())
+            except Exception:
+                self.abort()
+                raise
+
+    def _take_chunk(self):
+        chunk = self.buffer.getvalue()
+        self.buffer.seek(0)
+        self.buffer.truncate()
+        return chunk
+
+    def _upload_part(self, chunk):
+        if self.upload_id is None:
+            response = self.s3_client.create_multipart_upload(
+                Bucket=self.bucket_name,
+                Key=self.key,
+                ContentType=self.content_type
+            )
+            self.upload_id = response['UploadId']
+        # Keep the number of parts held in memory bounded by the pool size
+        pending = [future for _, future in self.parts if not future.done()]
+        if len(pending) >= UPLOAD_WORKERS:
+            pending[0].result()
+        part_number = len(self.parts) + 1
+        future = self.executor.submit(
+            self.s3_client.upload_part,
+            Bucket=self.bucket_name,
+            Key=self.key,
+            UploadId=self.upload_id,
+            PartNumber=part_number,
+            Body=chunk
+        )
+        self.parts.append((part_number, future))
+
+    def abort(self):
+        """
+        Aborts the multipart upload so S3 doesn't keep (and bill) the uploaded parts.
+        Parts still uploading are waited for first, as they could otherwise be stored after the abort.
+        """
+        if self.upload_id is None:
+            return
+        for _, future in self.parts:
+            future.cancel()
+        for _, future in self.parts:
+            if not future.cancelled():
+                future.exception()
+        try:
+            self.s3_client.abort_multipart_upload(
+                Bucket=self.bucket_name,
+                Key=self.key,
+                UploadId=self.upload_id
+            )
+        except Exception as err:
+            print(f"ERROR: error occurred while aborting the upload of {self.key}: {err}")
+        self.upload_id = None
+        self.parts = []
+
+    def close(self):
+        """
+        Flushes the remaining data and completes the upload, the upload is aborted if that fails.
+        """
+        if self.stream is not self.buffer:
+            self.stream.close()
+        chunk = self._take_chunk()
+        if self.upload_id is None:
+            self.s3_client.put_object(
+                Body=chunk,
+                Bucket=self.bucket_name,
+                Key=self.key,
+                ContentType=self.content_type
+            )
+            return
+        try:
+            self._upload_part(chunk)
+            completed = [
+                {'PartNumber': part_number, 'ETag': future.result()['ETag']}
+                for part_number, future in self.parts
+            ]
+            self.s3_client.complete_multipart_upload(
+                Bucket=self.bucket_name,
+                Key=self.key,
+                UploadId=self.upload_id,
+                MultipartUpload={'Parts': completed}
+            )
+        except Exception:
+            self.abort()
+            raise
+
+
+class S3Storage:
+    """
+    Stores objects in the data S3 bucket.
+    """
+    def __init__(self, bucket_name, s3_client=None):
+        self.bucket_name = bucket_name
+        self.s3_client = s3_client or boto3.client('s3')
+        self.executor = ThreadPoolExecutor(max_workers=UPLOAD_WORKERS)
+
+    def read_lines(self, key):
+        """
+        Reads a plain text object.
+
+        Returns:
+            list: The lines of the object, or an empty list if it does not exist.
+        """
+        try:
+            response = self.s3_client.get_object(Bucket=self.bucket_name, Key=key)
+            return response['Body'].read().decode().splitlines()
+        except self.s3_client.exceptions.NoSuchKey:
+            return []
+
+    def iter_lines(self, key):
+        """
+        Streams the lines of an object, decompressing .gz objects.
+
+        Yields:
+            str: The lines of the object, none if it does not exist.
+        """
+        try:
+            body = self.s3_client.get_object(Bucket=self.bucket_name, Key=key)['Body']
+        except self.s3_client.exceptions.NoSuchKey:
+            return
+        stream = gzip.GzipFile(fileobj=body) if key.endswith('.gz') else body
+        yield from iter_stream_lines(stream)
+
+    def list_keys(self, prefix, delimiter=None):
+        """
+        Lists the keys starting with prefix. With a delimiter only the part of the keys up to and
+        including the first delimiter after the prefix is returned, like listing a directory.
+
+        Returns:
+            list: The sorted keys or prefixes.
+        """
+        kwargs = {'Bucket': self.bucket_name, 'Prefix': prefix}
+        if delimiter:
+            kwargs['Delimiter'] = delimiter
+        keys = []
+        for page in self.s3_client.get_paginator('list_objects_v2').paginate(**kwargs):
+            keys.extend(item['Key'] for item in page.get('Contents', []))
+            keys.extend(item['Prefix'] for item in page.get('CommonPrefixes', []))
+        return sorted(keys)
+
+    def write_lines(self, key, lines):
+        """
+        Writes the lines as a plain text object.
+        """
+        self.s3_client.put_object(
+            Body="\n".join(lines),
+            Bucket=self.bucket_name,
+            Key=key
+        )
+
+    def open_writer(self, key):
+        """
+        Returns a writer streaming lines into the object, gzip compressed if the key ends with .gz.
+        """
+        return S3LineWriter(self.s3_client, self.bucket_name, key, self.executor, compress=key.endswith('.gz'))
+
+
+class LocalStorage:
+    """
+    Stores objects as files below a local directory, keys are relative paths.
+    """
+    def __init__(self, root_dir):
+        self.root_dir = root_dir
+
+    def _path(self, key):
+        path = os.path.join(self.root_dir, key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        return path
+
+    def read_lines(self, key):
+        try:
+            with open(os.path.join(self.root_dir, key)) as infile:
+                return infile.read().splitlines()
+        except FileNotFoundError:
+            return []
+
+    def iter_lines(self, key):
+        path = os.path.join(self.root_dir, key)
+        if not os.path.isfile(path):
+            return
+        with (gzip.open(path, 'rt') if key.endswith('.gz') else open(path)) as infile:
+            for line in infile:
+                yield line.rstrip("\n")
+
+    def list_keys(self, prefix, delimiter=None):
+        keys = set()
+        for dir_path, _, file_names in os.walk(self.root_dir):
+            for file_name in file_names:
+                key = os.path.relpath(os.path.join(dir_path, file_name), self.root_dir).replace(os.sep, "/")
+                if not key.startswith(prefix):
+                    continue
+                if delimiter and delimiter in key[len(prefix):]:
+                    key = key[:key.index(delimiter, len(prefix)) + len(delimiter)]
+                keys.add(key)
+        return sorted(keys)
+
+    def write_lines(self, key, lines):
+        with open(self._path(key), 'w') as outfile:
+            outfile.write("\n".join(lines))
+
+    def open_writer(self, key):
+        return LocalLineWriter(self._path(key))
+
+
+class LocalLineWriter:
+    """
+    Writer with the same interface as S3LineWriter backed by a local file.
+    """
+    def __init__(self, path):
+        self.file = gzip.open(path, 'wt') if path.endswith('.gz') else open(path, 'w')
+
+    def write(self, line):
+        self.file.write(f"{line}\n")
+
+    def close(self):
+        self.file.close()
+
+
+class CloudWatchLogSource:
+    """
+    Reads tool output written by the ECS containers to CloudWatch Logs.
+    """
+    def __init__(self, logs_client=None):
+        self.logs_client = logs_client or boto3.client('logs')
+
+    def get_log_streams(self, log_group_name):
+        """
+        Gets today's log streams from the specified log group.
+
+        Args:
+            log_group_name (str): The name of the log group.
+
+        Returns:
+            list: The list of log stream names for today.
+        """
+        try:
+            today = datetime.now().date()
+            today_streams = []
+            kwargs = {}
+            while True:
+                response = self.logs_client.describe_log_streams(logGroupName=log_group_name, orderBy='LastEventTime', descending=True, **kwargs)
+                reached_older = False
+                for stream in response['logStreams']:
+                    if 'lastEventTimestamp' not in stream:
+                        continue
+                    else:
+                        if datetime.fromtimestamp(stream['lastEventTimestamp'] / 1000).date() == today:
+                            today_streams.append(stream['logStreamName'])
+                        else:
+                            reached_older = True
+                # Streams are ordered by last event, later pages can't have today's streams
+                if reached_older or 'nextToken' not in response:
+                    break
+                kwargs['nextToken'] = response['nextToken']
+
+            return today_streams
+        except ClientError as err:
+            print(f"ERROR: error occurred while getting log streams: {err}")
+            return []
+
+    def iter_messages(self, log_group_name):
+        """
+        Yields the raw messages of today's log streams in the log group,
+        following the event pages until the end of each stream.
+        """
+        for stream in self.get_log_streams(log_group_name):
+            kwargs = {}
+            while True:
+                response = self.logs_client.get_log_events(
+                    logGroupName=log_group_name,
+                    logStreamName=stream,
+                    startFromHead=True,
+                    **kwargs
+                )
+                for event in response['events']:
+                    yield event['message']
+                # Pages can be empty before the end of the stream, which is only reached
+                # once the forward token is returned unchanged
+                if response['nextForwardToken'] == kwargs.get('nextToken'):
+                    break
+                kwargs['nextToken'] = response['nextForwardToken']
+
+
+class NdjsonLogSource:
+    """
+    Reads recorded tool output (e.g. subfinder -oJ) from NDJSON files,
+    one file per log stream.
+    """
+    def __init__(self, paths):
+        self.paths = paths
+
+    def iter_messages(self, log_group_name):
+        for pattern in self.paths:
+            for path in sorted(glob.glob(pattern)):
+                with open(path) as infile:
+                    for line in infile:
+                        if line.strip():
+                            yield line
+
+
+class LambdaAlertQueue:
+    """
+    Queues alerts by asynchronously invoking the alerting lambda.
+    """
+    def __init__(self, function_name='tf_alerting_lambda'):
+        self.function_name = function_name
+        self.lambda_client = boto3.client('lambda')
+
+    def send(self, data):
+        self.lambda_client.invoke(
+            FunctionName=self.function_name,
+            InvocationType='Event',
+            Payload=json.dumps(data).encode()
+        )
+
+
+class InProcessAlertQueue:
+    """
+    Hands alerts directly to a handler in the same process.
+    """
+    def __init__(self, handler):
+        self.handler = handler
+
+    def send(self, data):
+        self.handler(data)
+
+
+def configure(storage=None, log_source=None, alert_queue=None):
+    """
+    Overrides the backends used by the lambdas. Backends left as None
+    fall back to the AWS ones.
+    """
+    _backends.clear()
+    for name, backend in (("storage", storage), ("log_source", log_source), ("alert_queue", alert_queue)):
+        if backend is not None:
+            _backends[name] = backend
+
+
+def get_storage():
+    if "storage" not in _backends:
+        bucket_name = re.search(r'(.+)\.s3', os.environ['DATA_S3']).group(1)
+        _backends["storage"] = S3Storage(bucket_name)
+    return _backends["storage"]
+
+
+def get_log_source():
+    if "log_source" not in _backends:
+        _backends["log_source"] = CloudWatchLogSource()
+    return _backends["log_source"]
+
+
+def get_alert_queue():
+    if "alert_queue" not in _backends:
+        _backends["alert_queue"] = LambdaAlertQueue()
+    return _backends["alert_queue"]
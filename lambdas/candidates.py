@@ -0,0 +1,120 @@
+"""
+Lazy candidate subdomain generation for active discovery.
+
+Candidates come from a wordlist and from permutations of already known
+labels. Everything is a generator, so millions of candidates per target
+can be streamed to DNS resolution without holding them in memory.
+"""
+
+from collections import OrderedDict
+import itertools
+import re
+
+DEFAULT_WORDS = [
+    "www", "mail", "api", "dev", "staging", "stage", "test", "qa", "uat", "prod",
+    "admin", "portal", "vpn", "remote", "auth", "sso", "login", "beta", "internal", "intranet",
+    "cdn", "static", "assets", "img", "media", "app", "apps", "mobile", "m", "shop",
+    "git", "gitlab", "jenkins", "ci", "jira", "confluence", "grafana", "kibana", "monitor", "status",
+    "db", "sql", "backup", "old", "new", "demo", "sandbox", "docs", "help", "support",
+]
+# How far numbers found in labels are incremented and decremented (web1 -> web2, web3...)
+NUMBER_RANGE = 3
+MAX_LABEL_LENGTH = 63
+MAX_NAME_LENGTH = 253
+# Distinct names remembered to skip duplicates, sibling labels (web1, web2) produce the same variants
+DEDUP_WINDOW = 100000
+
+
+def is_valid(name):
+    if len(name) > MAX_NAME_LENGTH:
+        return False
+    return all(0 < len(label) <= MAX_LABEL_LENGTH and label[0] != "-" and label[-1] != "-" for label in name.split("."))
+
+
+def wordlist_candidates(target, words):
+    """
+    Yields a candidate for every word of the wordlist directly below the target.
+    """
+    for word in words:
+        yield f"{word}.{target}"
+
+
+def number_variants(label):
+    """
+    Yields the label with every number in it incremented and decremented, or with numbers appended.
+    """
+    matches = list(re.finditer(r"\d+", label))
+    if not matches:
+        for number in range(1, NUMBER_RANGE + 1):
+            yield f"{label}{number}"
+        return
+    for match in matches:
+        number = int(match.group())
+        for delta in range(-NUMBER_RANGE, NUMBER_RANGE + 1):
+            if delta == 0 or number + delta < 0:
+                continue
+            yield label[:match.start()] + str(number + delta).zfill(len(match.group())) + label[match.end():]
+
+
+def label_variants(label, words):
+    """
+    Yields permutations of a single label: number increments, insertions and dash and dot joins.
+    """
+    yield from number_variants(label)
+    for word in words:
+        yield f"{label}{word}"
+        yield f"{word}{label}"
+        yield f"{label}-{word}"
+        yield f"{word}-{label}"
+        yield f"{label}.{word}"
+        yield f"{word}.{label}"
+
+
+def permutation_candidates(target, known_domains, words):
+    """
+    Yields permutations of the leftmost label of every known subdomain of the target,
+    keeping the rest of the name.
+    """
+    # Sorted so siblings are permuted one after the other and their duplicates fall in the dedup window
+    for domain in sorted(known_domains):
+        if not domain.endswith(f".{target}"):
+            continue
+        label, _, rest = domain[:-len(target) - 1].partition(".")
+        suffix = f"{rest}.{target}" if rest else target
+        for variant in label_variants(label, words):
+            yield f"{variant}.{suffix}"
+
+
+def unique_recent(names, window=DEDUP_WINDOW):
+    """
+    Yields the names, skipping those already seen among the last window distinct names.
+    Memory stays bounded by the window whatever the number of names.
+    """
+    recent = OrderedDict()
+    for name in names:
+        if name in recent:
+            recent.move_to_end(name)
+            continue
+        recent[name] = None
+        if len(recent) > window:
+            recent.popitem(last=False)
+        yield name
+
+
+def generate_candidates(target, known_domains, words, limit=None):
+    """
+    Yields wordlist and permutation candidates for the target, skipping names that are
+    already known, not valid hostnames or duplicates of recent candidates.
+
+    Args:
+        target (str): The monitored domain.
+        known_domains (set): Subdomains already found for the target.
+        words (list): The wordlist.
+        limit (int): Maximum number of candidates to yield, None for all.
+    """
+    candidates = itertools.chain(
+        wordlist_candidates(target, words),
+        permutation_candidates(target, known_domains, words)
+    )
+    fresh = (name for name in map(str.lower, candidates) if name not in known_domains and is_valid(name))
+    return itertools.islice(unique_recent(fresh), limit)
@@ -1,50 +1,38 @@
 """
 Lambda that retrieves domains found by ECS tools, 
-check if they are alive and saves the domains and IPs in S3
+check if they are alive and saves the domains, IPs and HTTP fingerprints in S3
 """
 
 from botocore.exceptions import ClientError
-import boto3
 from datetime import datetime
+import hashlib
+import http.client
 import json
+import re
 import requests
-from requests.exceptions import ConnectionError, Timeout
+from requests.exceptions import ConnectionError, RequestException, Timeout
 import urllib3.exceptions
 import socket 
+import time
+import zlib
 from concurrent.futures import ThreadPoolExecutor
 from concurrent.futures import as_completed
-import re
-import os
-
-
-def get_log_streams(log_group_name):
-    """
-    Gets today's log streams from the specified log group.
+import backends
+import metrics
 
-    Args:
-        log_group_name (str): The name of the log group.
-
-    Returns:
-        list: The list of log stream names for today.
-    """
-    try:
-        logs_client = boto3.client('logs')
-        today = datetime.now().date()
-        streams = logs_client.describe_log_streams(logGroupName=log_group_name, orderBy='LastEventTime', descending=True)['logStreams']
+# Only this much of a body is downloaded for the fingerprint, however large the page is
+FINGERPRINT_BYTES = 4096
+# Seconds after the headers the body prefix is read for, however slowly the body is sent
+FINGERPRINT_SECONDS = 3
+# The body is read below urllib3, which would otherwise decode compressed bodies
+PROBE_HEADERS = {"Accept-Encoding": "identity"}
+TITLE_PATTERN = re.compile(rb"<title[^>]*>(.*?)</title>", re.IGNORECASE | re.DOTALL)
+# Long hex and base64 runs: nonces, CSRF tokens, session and build IDs that change on every request
+TOKEN_PATTERN = re.compile(rb"[0-9a-fA-F]{16,}|[A-Za-z0-9+/_-]{20,}={0,2}")
+# Bumped when the normalisation changes, fingerprints of different versions aren't compared
+FINGERPRINT_VERSION = 2
 
-        today_streams = []
-        for stream in streams:
-            if 'lastEventTimestamp' not in stream:
-                continue
-            else:
-                if datetime.fromtimestamp(stream['lastEventTimestamp'] / 1000).date() == today:
-                    today_streams.append(stream['logStreamName'])
 
-        return today_streams
-    except ClientError as err:
-        print(f"ERROR: error occurred while getting log streams: {err}")
-        return []
-    
 def get_domains(log_group_name):
     """
     Gets the list of domains from the log streams in the specified log group.
@@ -53,25 +41,20 @@ def get_domains(log_group_name):
         log_group_name (str): The name of the log group.
 
     Returns:
-        list: The list of unique domains found in the log streams.
+        dict: The unique domains found in the log streams mapped to the target they were found for.
     """
     try:   
-        streams = get_log_streams(log_group_name)
-        unique_domains = []
-        logs_client = boto3.client('logs')
-        for stream in streams:
-            response = logs_client.get_log_events(
-                logGroupName=log_group_name,
-                logStreamName=stream
-            )
-
-            for event in response['events']:
-                message = json.loads(event['message'])
-                unique_domains.append(message['host'])
+        unique_domains = {}
+        for raw_message in backends.get_log_source().iter_messages(log_group_name):
+            try:
+                message = json.loads(raw_message)
+                unique_domains.setdefault(message['host'], message.get('input', 'unknown'))
+            except (ValueError, KeyError, TypeError):
+                metrics.increment("parse_errors")
         return unique_domains
     except ClientError as e:
         print(f"ERROR: error occurred while getting domains from log streams: {e}")
-        return []
+        return {}
     
 def resolve_ips(domain):
     """
@@ -84,81 +67,267 @@ def resolve_ips(domain):
         str: The resolved IP address, or None if resolution fails.
     """
     try:
-        ip = socket.gethostbyname(domain)
+        with metrics.timed("dns_latency"):
+            ip = socket.gethostbyname(domain)
         return ip
     except (socket.gaierror, socket.timeout, urllib3.exceptions.ReadTimeoutError):
-        pass
+        metrics.increment("dns_failures")
     
 
-def check_if_alive(domain):
+def resolve_all_ips(domain):
     """
-    Checks if the domain is alive by sending a head request with a timeout of 3 seconds.
+    Resolves every IPv4 address of the given domain, names answered from a pool
+    of addresses (CDNs, load balancers) have several.
 
     Args:
-        domain (str): The domain to check.
+        domain (str): The domain to resolve.
 
     Returns:
-        tuple: A tuple containing the domain and its resolved IP address, or None if not alive.
+        list: The resolved IP addresses, empty if resolution fails.
     """
-    def get_domains_ips():
-        return (domain, resolve_ips(domain))
+    try:
+        with metrics.timed("dns_latency"):
+            return socket.gethostbyname_ex(domain)[2]
+    except (socket.gaierror, socket.herror, socket.timeout, urllib3.exceptions.ReadTimeoutError):
+        metrics.increment("dns_failures")
+        return []
+
+
+def normalise_body(prefix):
+    """
+    Masks the parts of a body prefix that change between requests of an unchanged page,
+    so they don't change the hash.
+
+    Args:
+        prefix (bytes): The start of the body.
+
+    Returns:
+        bytes: The prefix with long hex and base64 runs and numbers masked.
+    """
+    def mask_token(match):
+        token = match.group()
+        # Long words and dashed names without digits are kept, they are part of the page
+        if re.fullmatch(rb"[0-9a-fA-F]+", token) or re.search(rb"\d", token):
+            return b"T"
+        return token
+
+    return re.sub(rb"\d+", b"0", TOKEN_PATTERN.sub(mask_token, prefix))
 
+
+def iter_body_chunks(response):
+    """
+    Yields the body of a streamed response in chunks of whatever has arrived, so every
+    chunk takes at most one socket read. Responses not backed by an http.client
+    response (adapters, tests) are read with iter_content instead.
+    """
+    original = getattr(getattr(response, "raw", None), "_original_response", None)
+    if original is None or not hasattr(original, "read1"):
+        yield from response.iter_content(chunk_size=1024)
+        return
+    chunks = iter(lambda: original.read1(1024), b"")
+    # Servers ignoring Accept-Encoding: identity, gzip and zlib streams are told apart by their header
+    if response.headers.get("Content-Encoding", "").lower() in ("gzip", "deflate"):
+        decompressor = zlib.decompressobj(zlib.MAX_WBITS | 32)
+        chunks = map(decompressor.decompress, chunks)
+    yield from chunks
+
+
+def fingerprint(response):
+    """
+    Builds a fingerprint of the response from its headers and a streamed prefix of
+    at most FINGERPRINT_BYTES of the body, read for at most FINGERPRINT_SECONDS.
+    The connection is closed after the prefix, so the rest of the body is never downloaded.
+
+    Args:
+        response (requests.Response): A response requested with stream=True.
+
+    Returns:
+        dict: Status code, redirect target without query string, server header, title and hash of the body prefix.
+    """
+    prefix = b""
+    deadline = time.monotonic() + FINGERPRINT_SECONDS
     try:
-        response = requests.head(f'https://{domain}', timeout=3)
+        for chunk in iter_body_chunks(response):
+            prefix += chunk
+            if len(prefix) >= FINGERPRINT_BYTES or time.monotonic() >= deadline:
+                break
+    except (RequestException, urllib3.exceptions.HTTPError, http.client.HTTPException, OSError, ValueError, zlib.error):
+        pass
+    finally:
+        response.close()
+    prefix = prefix[:FINGERPRINT_BYTES]
+    title = TITLE_PATTERN.search(prefix)
+    location = response.headers.get("Location")
+    return {
+        "version": FINGERPRINT_VERSION,
+        "status": response.status_code,
+        # Redirects often carry per-request state (session IDs, return URLs) in the query string
+        "location": re.split(r"[?#]", location, maxsplit=1)[0] if location else location,
+        "server": response.headers.get("Server"),
+        "title": " ".join(title.group(1).decode(errors="replace").split())[:200] if title else None,
+        "body_hash": hashlib.sha256(normalise_body(prefix)).hexdigest()[:32],
+    }
+
+
+def probe(domain):
+    """
+    Checks if the domain is alive by sending a get request with a timeout of 3 seconds,
+    reading only the start of the body to fingerprint it.
+
+    Args:
+        domain (str): The domain to check.
+
+    Returns:
+        dict: The fingerprint of the domain, or None if not alive.
+    """
+    metrics.increment("probed")
+    try:
+        with metrics.timed("http_latency"):
+            response = requests.get(f'https://{domain}', timeout=3, stream=True, allow_redirects=False, headers=PROBE_HEADERS)
     except (ConnectionError):
         try:
-            response = requests.head(f'http://{domain}', timeout=3)
+            with metrics.timed("http_latency"):
+                response = requests.get(f'http://{domain}', timeout=3, stream=True, allow_redirects=False, headers=PROBE_HEADERS)
         except (ConnectionError):
-            pass
-        else:
-            #print(f'Domain http://{domain} [+++]')
-            return get_domains_ips()
+            return
+        except (urllib3.exceptions.ReadTimeoutError, Timeout):
+            metrics.increment("timeouts")
+            return
     except (urllib3.exceptions.ReadTimeoutError, Timeout):
+        metrics.increment("timeouts")
         return
-    else:
-        #print(f'Domain https://{domain} [+++]')
-        return get_domains_ips()
+    metrics.increment("alive")
+    return fingerprint(response)
+
+
+def check_if_alive(domain):
+    """
+    Probes the domain and resolves its IP address if it is alive.
+
+    Args:
+        domain (str): The domain to check.
+
+    Returns:
+        tuple: A tuple containing the domain, its resolved IP address and fingerprint, or None if not alive.
+    """
+    host_fingerprint = probe(domain)
+    if host_fingerprint is not None:
+        return (domain, resolve_ips(domain), host_fingerprint)
 
-def upload_to_s3(bucket_name, filename, data):
+class ResultWriter:
     """
-    Uploads the data to S3 bucket with the specified filename.
+    Writes alive domains, their IPs and fingerprints partitioned by target and run ID:
+    results/<target>/<date>/<run_id>/domains.txt.gz, ips.txt.gz and fingerprints.txt.gz.
+    Every run gets its own objects so earlier runs of the day are kept.
+    """
+    def __init__(self, storage, date, run_id):
+        self.storage = storage
+        self.date = date
+        self.run_id = run_id
+        self.writers = {}
+        self.seen_ips = {}
+
+    def _key(self, target, name):
+        return f"results/{target}/{self.date}/{self.run_id}/{name}.txt.gz"
+
+    def _write(self, target, name, line):
+        if (target, name) not in self.writers:
+            self.writers[(target, name)] = self.storage.open_writer(self._key(target, name))
+        writer = self.writers[(target, name)]
+        # A failed upload was aborted, the other objects of the run are still written
+        if writer is None:
+            return
+        try:
+            writer.write(line)
+        except Exception as err:
+            print(f"ERROR: error occurred while uploading {self._key(target, name)}: {err}")
+            metrics.increment("upload_failures")
+            self.writers[(target, name)] = None
+
+    def write(self, target, domain, ip, fingerprint=None):
+        self._write(target, 'domains', domain)
+        if fingerprint:
+            self._write(target, 'fingerprints', json.dumps({"host": domain, **fingerprint}))
+        seen = self.seen_ips.setdefault(target, set())
+        if ip and ip not in seen:
+            seen.add(ip)
+            self._write(target, 'ips', ip)
+
+    def close(self):
+        """
+        Completes every upload, a failing one doesn't keep the others from completing.
+        """
+        for (target, name), writer in self.writers.items():
+            if writer is None:
+                continue
+            try:
+                writer.close()
+            except Exception as err:
+                print(f"ERROR: error occurred while uploading {self._key(target, name)}: {err}")
+                metrics.increment("upload_failures")
+
+
+def rebuild_daily_views(storage, date):
+    """
+    Rebuilds <date>_domains.txt, <date>_ips.txt and <date>_fingerprints.txt, kept for
+    compatibility, by streaming the lines of every run's partitions of the day into them
+    in run order. Only one part of each object is held in memory however large the day gets.
+    Lines found by several runs are repeated, readers treat the files as sets (the latest
+    fingerprint of a host wins).
 
     Args:
-        bucket_name (str): The name of the S3 bucket.
-        filename (str): The filename to use for the uploaded file.
-        data (list): The data to upload as lines in the file.
+        storage: The storage backend.
+        date (str): The day, as YYYY-MM-DD.
     """
-    try:
-        s3_client = boto3.client('s3')
-        s3_client.put_object(
-            Body="\n".join(data),
-            Bucket=bucket_name,
-            Key=filename
-        )
-    except ClientError as err:
-        print(f"ERROR: error occurred while uploading to S3: {err}")
+    partitions = [
+        key
+        for target in storage.list_keys("results/", delimiter="/")
+        for key in storage.list_keys(f"{target}{date}/")
+    ]
+    # results/<target>/<date>/<run_id>/<name>.txt.gz
+    partitions.sort(key=lambda key: key.split("/")[3])
+    for name in ("domains", "ips", "fingerprints"):
+        filename = f"{date}_{name}.txt"
+        try:
+            writer = storage.open_writer(filename)
+            for key in partitions:
+                if key.endswith(f"/{name}.txt.gz"):
+                    for line in storage.iter_lines(key):
+                        writer.write(line)
+            writer.close()
+        except Exception as err:
+            print(f"ERROR: error occurred while writing {filename}: {err}")
+            metrics.increment("upload_failures")
 
 
 def lambda_handler(event, context):
-    try:
-        alive_domains = []
-        ips = []
-        sub_domains = get_domains("/ecs/domain_enumerator")
-        with ThreadPoolExecutor() as executor:
-            future_list = [executor.submit(check_if_alive, domain) for domain in sub_domains]
-            for future in as_completed(future_list):
-                result = future.result()
-                if result:
-                    domain, ip = result
-                    ips.append(ip)
-                    alive_domains.append(domain)
-            ips = list(dict.fromkeys(ips))            
-        domain_file = f"{datetime.now().strftime('%Y-%m-%d')}_domains.txt"
-        ip_file = f"{datetime.now().strftime('%Y-%m-%d')}_ips.txt"
-        s3_bucket = re.search(r'(.+)\.s3', os.environ['DATA_S3']).group(1)
-        upload_to_s3(s3_bucket, domain_file, alive_domains)
-        upload_to_s3(s3_bucket, ip_file, ips)  
-    except Exception as err:
-        print(f"ERROR: error occurred in the lambda_handler: {err}")
+    with metrics.invocation("check_if_alive_lambda", context):
+        try:
+            now = datetime.now()
+            storage = backends.get_storage()
+            writer = ResultWriter(storage, now.strftime('%Y-%m-%d'), now.strftime('%Y%m%dT%H%M%S'))
+            with metrics.stage("ingestion"):
+                sub_domains = get_domains("/ecs/domain_enumerator")
+            metrics.increment("domains_found", len(sub_domains))
+            try:
+                with metrics.stage("probe"), ThreadPoolExecutor() as executor:
+                    future_list = {executor.submit(check_if_alive, domain): domain for domain in sub_domains}
+                    for future in as_completed(future_list):
+                        try:
+                            result = future.result()
+                        except Exception as err:
+                            print(f"ERROR: error occurred while probing {future_list[future]}: {err}")
+                            metrics.increment("probe_errors")
+                            continue
+                        if result:
+                            domain, ip, host_fingerprint = result
+                            writer.write(sub_domains[domain], domain, ip, host_fingerprint)
+            finally:
+                # Whatever was probed before an error is still uploaded
+                with metrics.stage("upload"):
+                    writer.close()
+                    rebuild_daily_views(storage, now.strftime('%Y-%m-%d'))
+        except Exception as err:
+            print(f"ERROR: error occurred in the lambda_handler: {err}")
 
 #lambda_handler(0,0)
@@ -1,46 +1,114 @@
-import boto3
 import datetime
-import re
-import os
 import json
+import backends
+import metrics
 
-s3 = boto3.client('s3')
+# Fingerprint fields compared between days, a change in any of them raises an alert
+FINGERPRINT_FIELDS = ["status", "location", "server", "title", "body_hash"]
+# Discord rejects messages with more than 2000 characters of content
+ALERT_MAX_LENGTH = 2000
 
-def get_domain_list(date,bucket_name):
+def get_domain_list(date):
     """
     Retrieves the domain list from the S3 bucket for the given date.
 
     Args:
         date (datetime.date): The date for which to retrieve the domain list.
-        bucket_name (str): The name of the S3 bucket.
 
     Returns:
-        list: The domain list for the given date.
+        set: The domains for the given date.
     """
     list_key = date.strftime("%Y-%m-%d") + '_domains.txt'
+    return set(backends.get_storage().iter_lines(list_key))
 
-    try:
-        response = s3.get_object(Bucket=bucket_name, Key=list_key)
-        domain_list = response['Body'].read().decode().splitlines()
-        return domain_list
-    except s3.exceptions.NoSuchKey:
-        return []
+def get_fingerprints(date):
+    """
+    Retrieves the HTTP fingerprints from the S3 bucket for the given date.
+
+    Args:
+        date (datetime.date): The date for which to retrieve the fingerprints.
+
+    Returns:
+        dict: The fingerprints for the given date, by host.
+    """
+    fingerprints = {}
+    for line in backends.get_storage().iter_lines(date.strftime("%Y-%m-%d") + '_fingerprints.txt'):
+        try:
+            fingerprint = json.loads(line)
+            fingerprints[fingerprint["host"]] = fingerprint
+        except (ValueError, KeyError, TypeError):
+            metrics.increment("parse_errors")
+    return fingerprints
 
 def send_data_to_lambda(data):
     """
-    Invokes alerting lambda to send notifications
+    Queues the alert for the alerting lambda to send notifications
     """    
-    client = boto3.client('lambda')
     try:
-        response = client.invoke(
-            FunctionName='tf_alerting_lambda',
-            InvocationType='Event',
-            Payload=json.dumps(data).encode()
-        )
+        backends.get_alert_queue().send(data)
+        metrics.increment("alerts_queued")
     except Exception as err:
         print(f"ERROR: Failed to invoke the alerting lambda: {str(err)}")
 
 
+def format_message(action, domains):
+    message = {
+        "action": action,
+        "message": list(domains),
+        "alert_type": "discord"
+    }
+    return message
+
+
+def batch_messages(action, items, max_length=ALERT_MAX_LENGTH):
+    """
+    Splits the items into lists whose alert text, "<action>,<list>" as built by the
+    alerting lambda, fits in max_length characters. Items too long on their own are truncated.
+
+    Args:
+        action (str): The alert action.
+        items (iterable): The alert lines.
+
+    Yields:
+        list: The items of one alert.
+    """
+    # "<action>," and the list brackets
+    overhead = len(action) + 3
+
+    def truncate(item):
+        cut = max_length - overhead - 5
+        # Quotes and escapes make the repr longer than the item
+        while len(repr(item[:cut] + "...")) + overhead > max_length:
+            cut -= len(repr(item[:cut] + "...")) + overhead - max_length
+        return item[:cut] + "..."
+
+    batch = []
+    # Items are separated by ", " in the list, counted for the first one too
+    length = overhead - 2
+    for item in items:
+        item_length = len(repr(item)) + 2
+        if item_length + overhead - 2 > max_length:
+            item = truncate(item)
+            item_length = len(repr(item)) + 2
+        if length + item_length > max_length:
+            yield batch
+            batch = []
+            length = overhead - 2
+        batch.append(item)
+        length += item_length
+    if batch:
+        yield batch
+
+def send_alerts(action, items):
+    """
+    Queues the items as alerts of the action, split so every alert fits in one Discord message.
+    """
+    for batch in batch_messages(action, items):
+        json_data = format_message(action, batch)
+        send_data_to_lambda(json_data)
+        print(json.dumps(json_data))
+
+
 def compare_domain_lists(previous_list, current_list):
     """
     Compares the previous day's domain list with the current day's domain list
@@ -50,37 +118,59 @@ def compare_domain_lists(previous_list, current_list):
         previous_list (list): The domain list from the previous day.
         current_list (list): The domain list from the current day.
     """
-    def format_message(action, domains):
-        message = {
-            "action": action,
-            "message": list(domains),
-            "alert_type": "discord"
-        }
-        return message
-
     #removed_domains = set(previous_list) - set(current_list)
     new_domains = set(current_list) - set(previous_list)
+    metrics.increment("new_domains", len(new_domains))
     
     # if removed_domains:
     #     json_data = format_message("removed",removed_domains)
     #     send_data_to_lambda(json_data)
     #     print(json.dumps(json_data))
     if new_domains:
-        json_data = format_message("new",new_domains)
-        send_data_to_lambda(json_data)
-        print(json.dumps(json_data))
+        send_alerts("new", sorted(new_domains))
+
+def compare_fingerprints(previous_fingerprints, current_fingerprints):
+    """
+    Compares the previous day's fingerprints with the current day's and reports
+    hosts seen on both days whose fingerprint changed, e.g. a new page on an old host.
+
+    Args:
+        previous_fingerprints (dict): The fingerprints from the previous day, by host.
+        current_fingerprints (dict): The fingerprints from the current day, by host.
+    """
+    changed_hosts = []
+    for host, current in current_fingerprints.items():
+        previous = previous_fingerprints.get(host)
+        # Fingerprints normalised differently would all differ
+        if previous is None or previous.get("version") != current.get("version"):
+            continue
+        changes = [
+            f"{field}: {previous.get(field)} -> {current.get(field)}"
+            for field in FINGERPRINT_FIELDS if previous.get(field) != current.get(field)
+        ]
+        if changes:
+            changed_hosts.append(f"{host} ({'; '.join(changes)})")
+    metrics.increment("changed_hosts", len(changed_hosts))
+
+    if changed_hosts:
+        send_alerts("changed", changed_hosts)
 
 def lambda_handler(event, context):
     """
-    AWS Lambda handler function that compares domain lists for the current
-    day and the previous day.
+    AWS Lambda handler function that compares domain lists and fingerprints
+    for the current day and the previous day.
     """
-    s3_bucket = re.search(r'(.+)\.s3', os.environ['DATA_S3']).group(1)
-    today = datetime.date.today()
-    previous_day = today - datetime.timedelta(days=1)
+    with metrics.invocation("compare_lambda", context):
+        today = datetime.date.today()
+        previous_day = today - datetime.timedelta(days=1)
 
-    previous_list = get_domain_list(previous_day, s3_bucket)
-    current_list = get_domain_list(today, s3_bucket)
-    compare_domain_lists(previous_list, current_list)
+        with metrics.stage("load"):
+            previous_list = get_domain_list(previous_day)
+            current_list = get_domain_list(today)
+            previous_fingerprints = get_fingerprints(previous_day)
+            current_fingerprints = get_fingerprints(today)
+        with metrics.stage("compare"):
+            compare_domain_lists(previous_list, current_list)
+            compare_fingerprints(previous_fingerprints, current_fingerprints)
 
 #lambda_handler(0, 0)
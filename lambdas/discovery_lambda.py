@@ -0,0 +1,211 @@
+"""
+Lambda that actively discovers subdomains the passive tools don't know about.
+Candidates from a wordlist and permutations of known subdomains are resolved
+in bulk, wildcard answers are filtered out and only resolving names are
+checked if alive and saved in S3 like check_if_alive_lambda results.
+"""
+
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, as_completed, wait
+from datetime import datetime, timedelta
+import uuid
+import backends
+import candidates
+import metrics
+from check_if_alive_lambda import ResultWriter, probe, rebuild_daily_views, resolve_all_ips
+
+DNS_WORKERS = 64
+# Futures queued on the resolver pool, this bounds memory whatever the number of candidates
+MAX_IN_FLIGHT = DNS_WORKERS * 4
+MAX_CANDIDATES = 200000
+# Random labels queried per parent, enough to see most of a rotating wildcard address pool
+WILDCARD_PROBES = 6
+# Days looked back for the latest _domains.txt to take known labels from
+KNOWN_DOMAINS_DAYS = 7
+PROBE_WORKERS = 32
+# Stop resolving when less than this is left before the lambda timeout, to probe and upload
+PROBE_RESERVE_MS = 120000
+# Stop probing when less than this is left, to let in-flight probes finish and upload
+UPLOAD_RESERVE_MS = 45000
+
+
+def retrieve_words():
+    """
+    Retrieves the wordlist from S3, falling back to the built-in one.
+
+    Returns:
+        list: The list of words.
+    """
+    words = [word.strip().lower() for word in backends.get_storage().read_lines('wordlist.txt') if word.strip()]
+    return words or candidates.DEFAULT_WORDS
+
+
+def retrieve_known_domains(today):
+    """
+    Retrieves the latest daily domain list from the previous days.
+
+    Args:
+        today (datetime.date): The date to start looking back from.
+
+    Returns:
+        set: The known domains.
+    """
+    for days in range(KNOWN_DOMAINS_DAYS):
+        date = today - timedelta(days=days)
+        domains = set(backends.get_storage().iter_lines(f"{date.strftime('%Y-%m-%d')}_domains.txt"))
+        if domains:
+            return domains
+    return set()
+
+
+class WildcardFilter:
+    """
+    Detects names that only resolve because of a wildcard record. The parent of every
+    resolving name is queried with random labels once; if those resolve too, answers
+    sharing an address with them are wildcard answers. All A records are compared,
+    as wildcards of CDNs and load balancers answer from a rotating pool of addresses.
+    """
+    def __init__(self, probes=WILDCARD_PROBES):
+        self.probes = probes
+        self.wildcard_ips = {}
+
+    def _parent_ips(self, parent):
+        if parent not in self.wildcard_ips:
+            self.wildcard_ips[parent] = {
+                ip for _ in range(self.probes) for ip in resolve_all_ips(f"{uuid.uuid4().hex[:16]}.{parent}")
+            }
+        return self.wildcard_ips[parent]
+
+    def is_wildcard(self, name, ips):
+        parent = name.split(".", 1)[1]
+        return not self._parent_ips(parent).isdisjoint(ips)
+
+
+def map_bounded(func, items, should_stop=lambda: False, workers=DNS_WORKERS, max_in_flight=MAX_IN_FLIGHT):
+    """
+    Runs func on the items in a thread pool, keeping at most max_in_flight calls queued.
+
+    Args:
+        func (callable): Called with every item.
+        items (iterable): The items, consumed lazily.
+        should_stop (callable): Returns True when no more items should be submitted.
+
+    Yields:
+        tuple: Every submitted item and the result of func, in completion order.
+    """
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        pending = {}
+        for item in items:
+            if len(pending) >= max_in_flight:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    yield pending.pop(future), future.result()
+            if should_stop():
+                break
+            pending[executor.submit(func, item)] = item
+        for future in as_completed(pending):
+            yield pending[future], future.result()
+
+
+def resolve_candidates(names, should_stop=lambda: False, workers=DNS_WORKERS, max_in_flight=MAX_IN_FLIGHT):
+    """
+    Resolves names in bulk, keeping at most max_in_flight lookups queued.
+
+    Args:
+        names (iterable): Candidate names, consumed lazily.
+        should_stop (callable): Returns True when no more names should be submitted.
+
+    Yields:
+        tuple: The name and its IP addresses for every name that resolves.
+    """
+    def resolve(name):
+        metrics.increment("candidates")
+        return resolve_all_ips(name)
+
+    for name, ips in map_bounded(resolve, names, should_stop, workers, max_in_flight):
+        if ips:
+            yield name, ips
+
+
+def discover(targets, known_domains, words, max_candidates=MAX_CANDIDATES, should_stop=lambda: False):
+    """
+    Generates and resolves candidates for every target.
+
+    Returns:
+        dict: The resolving, non-wildcard names mapped to their target and IP address.
+    """
+    resolved = {}
+    for target in targets:
+        wildcard_filter = WildcardFilter()
+        names = candidates.generate_candidates(target, known_domains, words, max_candidates)
+        for name, ips in resolve_candidates(names, should_stop):
+            if wildcard_filter.is_wildcard(name, ips):
+                metrics.increment("wildcard_filtered")
+                continue
+            metrics.increment("resolved")
+            resolved[name] = (target, ips[0])
+        if should_stop():
+            print(f"INFO: stopped discovery at {target}, lambda is running out of time")
+            break
+    return resolved
+
+
+def probe_host(domain):
+    """
+    Probes the domain, an error of one host is logged instead of ending the run.
+
+    Returns:
+        dict: The fingerprint of the domain, or None if not alive or the probe failed.
+    """
+    try:
+        return probe(domain)
+    except Exception as err:
+        print(f"ERROR: error occurred while probing {domain}: {err}")
+        metrics.increment("probe_errors")
+
+
+def running_out_of_time(context, reserve_ms):
+    """
+    Returns a callable telling whether less than reserve_ms is left before the lambda times out.
+    """
+    return lambda: context is not None and context.get_remaining_time_in_millis() < reserve_ms
+
+
+def lambda_handler(event, context):
+    with metrics.invocation("discovery_lambda", context):
+        try:
+            now = datetime.now()
+            targets = backends.get_storage().read_lines('targets.txt')
+            with metrics.stage("resolve"):
+                resolved = discover(
+                    [target.strip().lower() for target in targets if target.strip()],
+                    retrieve_known_domains(now.date()),
+                    retrieve_words(),
+                    event.get("max_candidates", MAX_CANDIDATES),
+                    running_out_of_time(context, PROBE_RESERVE_MS)
+                )
+            probed = 0
+            alive = 0
+            storage = backends.get_storage()
+            writer = ResultWriter(storage, now.strftime('%Y-%m-%d'), f"{now.strftime('%Y%m%dT%H%M%S')}-discovery")
+            should_stop = running_out_of_time(context, UPLOAD_RESERVE_MS)
+            try:
+                with metrics.stage("probe"):
+                    # The IPs are known from resolution, so hosts are only probed and not resolved again
+                    for domain, host_fingerprint in map_bounded(probe_host, resolved, should_stop, PROBE_WORKERS, PROBE_WORKERS * 2):
+                        probed += 1
+                        if host_fingerprint is not None:
+                            target, ip = resolved[domain]
+                            writer.write(target, domain, ip, host_fingerprint)
+                            alive += 1
+                if probed < len(resolved):
+                    print(f"INFO: stopped probing after {probed} of {len(resolved)} names, lambda is running out of time")
+            finally:
+                # Whatever was probed before an error is still uploaded
+                with metrics.stage("upload"):
+                    writer.close()
+                    rebuild_daily_views(storage, now.strftime('%Y-%m-%d'))
+            print(f"INFO: discovered {alive} alive out of {len(resolved)} resolving candidates")
+        except Exception as err:
+            print(f"ERROR: error occurred in the lambda_handler: {err}")
+
+#lambda_handler({"max_candidates": 1000}, None)
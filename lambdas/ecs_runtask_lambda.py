@@ -7,7 +7,8 @@ import boto3
 from botocore.exceptions import ClientError
 import json
 import os
-import re
+import backends
+import metrics
 
 def run_tasks(commands_passed_to_container):
     """
@@ -46,21 +47,16 @@ def run_tasks(commands_passed_to_container):
     else:
         return response
 
-def retrieve_domains(bucket_name):
+def retrieve_domains():
     """
     Retrieves the domains "targets" from S3.
 
-    Args:
-        bucket_name (str): The name of the S3 bucket.
-
     Returns:
         list: The list of domains.
     """
-    s3 = boto3.client('s3')
     file_name = 'targets.txt'
     try:
-        response = s3.get_object(Bucket=bucket_name, Key=file_name)
-        domains = response['Body'].read().decode().splitlines()
+        domains = backends.get_storage().read_lines(file_name)
         return domains        
     except ClientError as err:
         print(f"ERROR: error while retrieving domains {err}")
@@ -82,21 +78,24 @@ def run_tools(data, domains):
                 "name": tool_name,
                 "command": tool_command.split() + [domain] 
             })
-        response = run_tasks(commands_passed_to_container)
+        with metrics.timed("run_task_latency"):
+            response = run_tasks(commands_passed_to_container)
+        metrics.increment("tasks_started")
         task_id = response['tasks'][0]['taskArn']
         print(f'INFO: Started task {task_id} for {domain}')
 
 def lambda_handler(event, context):
-    try:
-        s3_bucket_name =  re.search(r'(.+)\.s3', os.environ['DATA_S3']).group(1)
-        domains = retrieve_domains(s3_bucket_name)
-        run_tools(event, domains)
-    except Exception as err:
-        print(f"ERROR: error occurred in the lambda_handler: {err}")
-        return {
-            'statusCode': 500,
-            'body': json.dumps(str(err))
-        }
+    with metrics.invocation("ecs_runtask_lambda", context):
+        try:
+            domains = retrieve_domains()
+            metrics.increment("targets", len(domains or []))
+            run_tools(event, domains)
+        except Exception as err:
+            print(f"ERROR: error occurred in the lambda_handler: {err}")
+            return {
+                'statusCode': 500,
+                'body': json.dumps(str(err))
+            }
 
 #Test using this:
 # data = {
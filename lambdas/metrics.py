@@ -0,0 +1,248 @@
+"""
+Per-stage timers, counters and latency histograms shared by the lambdas.
+
+Every lambda_handler runs inside invocation(), which resets the recorder and
+at the end prints one CloudWatch Embedded Metric Format (EMF) line, so the
+metrics show up in CloudWatch without extra API calls. Setting the
+SAMPLING_PROFILER environment variable to 1 (every invocation) or a fraction
+(e.g. 0.1 for ~10% of invocations) also prints collapsed stacks of a
+sampling profiler for that invocation.
+"""
+
+from collections import Counter
+import contextlib
+import json
+import math
+import os
+import random
+import sys
+import threading
+import time
+
+NAMESPACE = "DomainEnumerator"
+# Histogram buckets grow by 5%, so percentiles are within ~2.5% of the real value
+BUCKET_GROWTH = 1.05
+PROFILE_TOP_STACKS = 25
+# Seconds before the lambda timeout at which metrics of a still running invocation are printed
+TIMEOUT_FLUSH_MARGIN = 1.0
+
+
+class Histogram:
+    """
+    Latency histogram with logarithmic buckets, memory stays bounded however many values are observed.
+    """
+    def __init__(self):
+        self.buckets = Counter()
+        self.count = 0
+        self.max = 0.0
+
+    def observe(self, value):
+        self.buckets[math.floor(math.log(max(value, 0.001), BUCKET_GROWTH))] += 1
+        self.count += 1
+        self.max = max(self.max, value)
+
+    def percentile(self, fraction):
+        remaining = self.count * fraction
+        for bucket in sorted(self.buckets):
+            remaining -= self.buckets[bucket]
+            if remaining <= 0:
+                return min(self.max, BUCKET_GROWTH ** (bucket + 0.5))
+        return self.max
+
+
+class Recorder:
+    """
+    Collects the metrics of one invocation. Safe to use from the probe threads.
+    """
+    def __init__(self, function_name=None):
+        self.function_name = function_name
+        self.lock = threading.Lock()
+        self.counters = Counter()
+        self.timers = {}
+        self.histograms = {}
+
+    def increment(self, name, value=1):
+        with self.lock:
+            self.counters[name] += value
+
+    def observe(self, name, value):
+        with self.lock:
+            self.histograms.setdefault(name, Histogram()).observe(value)
+
+    def add_time(self, name, value):
+        with self.lock:
+            self.timers[name] = self.timers.get(name, 0.0) + value
+
+    def to_emf(self, extra_metrics=(), **dimensions):
+        """
+        Returns the collected metrics as an EMF document.
+
+        Args:
+            extra_metrics (iterable): (name, value, unit) tuples published next to the collected metrics.
+            dimensions: Dimensions published in addition to FunctionName.
+        """
+        values = {}
+        definitions = []
+        with self.lock:
+            metrics = [(name, value, "Count") for name, value in self.counters.items()]
+            metrics += [(f"{name}_ms", round(value, 3), "Milliseconds") for name, value in self.timers.items()]
+            # EMF has no histogram type, percentiles are published as separate metrics
+            for name, histogram in self.histograms.items():
+                for suffix, value in (("p50", histogram.percentile(0.5)), ("p99", histogram.percentile(0.99)), ("max", histogram.max)):
+                    metrics.append((f"{name}_{suffix}_ms", round(value, 3), "Milliseconds"))
+        for name, value, unit in [*metrics, *extra_metrics]:
+            values[name] = value
+            definitions.append({"Name": name, "Unit": unit})
+        return {
+            "_aws": {
+                "Timestamp": int(time.time() * 1000),
+                "CloudWatchMetrics": [{
+                    "Namespace": NAMESPACE,
+                    "Dimensions": [["FunctionName", *dimensions]],
+                    "Metrics": definitions
+                }]
+            },
+            "FunctionName": self.function_name,
+            **dimensions,
+            **values
+        }
+
+
+class SamplingProfiler:
+    """
+    Samples the stacks of all threads at a fixed interval and counts them as collapsed
+    stacks ("outer;inner;innermost"), the input format of flame graph tools.
+    """
+    def __init__(self, interval=0.01):
+        self.interval = interval
+        self.lock = threading.Lock()
+        self.stacks = Counter()
+        self.samples = 0
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        own_id = threading.get_ident()
+        while not self.stopped.wait(self.interval):
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{os.path.basename(code.co_filename)}:{code.co_name}:{frame.f_lineno}")
+                    frame = frame.f_back
+                with self.lock:
+                    self.stacks[";".join(reversed(stack))] += 1
+            self.samples += 1
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.stopped.set()
+        self.thread.join()
+
+    def to_dict(self):
+        with self.lock:
+            return {
+                "interval_ms": self.interval * 1000,
+                "samples": self.samples,
+                "stacks": self.stacks.most_common(PROFILE_TOP_STACKS)
+            }
+
+
+_recorder = Recorder()
+
+
+def increment(name, value=1):
+    """
+    Adds value to the counter.
+    """
+    _recorder.increment(name, value)
+
+
+def observe(name, value):
+    """
+    Adds a latency in milliseconds to the histogram.
+    """
+    _recorder.observe(name, value)
+
+
+@contextlib.contextmanager
+def stage(name):
+    """
+    Times the enclosed block and adds it to the stage timer.
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        _recorder.add_time(name, (time.perf_counter() - start) * 1000)
+
+
+@contextlib.contextmanager
+def timed(name):
+    """
+    Times the enclosed block and adds it to the latency histogram.
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        _recorder.observe(name, (time.perf_counter() - start) * 1000)
+
+
+def _profiler_enabled():
+    try:
+        rate = float(os.environ.get("SAMPLING_PROFILER", "0"))
+    except ValueError:
+        return False
+    return rate > 0 and random.random() < rate
+
+
+@contextlib.contextmanager
+def invocation(function_name, context=None):
+    """
+    Collects the metrics of one lambda invocation and prints them as an EMF line when it ends.
+    With the lambda context given, the metrics so far are also printed just before the invocation
+    would time out, so runs killed by the timeout still report where the time went. That line is
+    published under an extra Flush=timeout dimension with a timed_out count, so it isn't added to
+    the complete line printed if the invocation finishes after all.
+    """
+    global _recorder
+    recorder = _recorder = Recorder(function_name)
+    start = time.perf_counter()
+    profiler = None
+    if _profiler_enabled():
+        interval = float(os.environ.get("SAMPLING_PROFILER_INTERVAL_MS", "10")) / 1000
+        profiler = SamplingProfiler(interval).start()
+    print_lock = threading.Lock()
+
+    def flush_partial():
+        with print_lock:
+            elapsed = (time.perf_counter() - start) * 1000
+            if profiler:
+                print(json.dumps({"FunctionName": function_name, "partial": True, "profile": profiler.to_dict()}))
+            print(json.dumps(recorder.to_emf([("invocation_ms", round(elapsed, 3), "Milliseconds"), ("timed_out", 1, "Count")], Flush="timeout")))
+
+    def flush():
+        with print_lock:
+            recorder.add_time("invocation", (time.perf_counter() - start) * 1000)
+            if profiler:
+                profiler.stop()
+                print(json.dumps({"FunctionName": function_name, "profile": profiler.to_dict()}))
+            print(json.dumps(recorder.to_emf()))
+
+    deadline = None
+    if context is not None:
+        deadline = threading.Timer(max(0, context.get_remaining_time_in_millis() / 1000 - TIMEOUT_FLUSH_MARGIN), flush_partial)
+        deadline.daemon = True
+        deadline.start()
+    try:
+        yield recorder
+    finally:
+        if deadline:
+            deadline.cancel()
+        flush()
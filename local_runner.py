@@ -0,0 +1,79 @@
+"""
+Runs the lambda pipeline locally without AWS.
+
+Recorded tool output (subfinder -oJ NDJSON files) is fed through ingestion,
+liveness checks, compare and alerting. A local directory is used instead of
+the data S3 bucket and alerts are handed to an in-process sink that prints them.
+
+Usage example:
+
+python3 local_runner.py -i recorded/*.json -o local_data
+"""
+
+import argparse
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "lambdas"))
+
+import backends
+import alerting_lambda
+import check_if_alive_lambda
+import compare_lambda
+import discovery_lambda
+
+
+def alert_sink(alerts):
+    """
+    Returns an alert handler that collects and prints alerts instead of sending them.
+
+    Args:
+        alerts (list): The list the received alerts are appended to.
+    """
+    def handle(data):
+        alerts.append(data)
+        print(f"ALERT ({data['alert_type']}): {alerting_lambda.format_alert(data)}")
+    return handle
+
+
+def run_pipeline(input_paths, data_dir, discovery=None):
+    """
+    Runs check_if_alive, optionally discovery, and compare lambdas against the local backends.
+
+    Args:
+        input_paths (list): NDJSON files or glob patterns with recorded tool output.
+        data_dir (str): Directory used as the data bucket.
+        discovery (dict): Event for discovery_lambda, None to skip active discovery.
+
+    Returns:
+        list: The alerts raised during the run.
+    """
+    alerts = []
+    backends.configure(
+        storage=backends.LocalStorage(data_dir),
+        log_source=backends.NdjsonLogSource(input_paths),
+        alert_queue=backends.InProcessAlertQueue(alert_sink(alerts))
+    )
+    print("INFO: running ingestion and liveness checks")
+    check_if_alive_lambda.lambda_handler({}, None)
+    if discovery is not None:
+        print("INFO: running active discovery")
+        discovery_lambda.lambda_handler(discovery, None)
+    print("INFO: comparing with previous day")
+    compare_lambda.lambda_handler({}, None)
+    return alerts
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run the domain enumerator pipeline locally on recorded tool output.")
+    parser.add_argument("-i", "--input", help="Recorded subfinder NDJSON files (globs allowed)", nargs='+', required=True)
+    parser.add_argument("-o", "--output", help="Local directory used as data storage", default="local_data")
+    parser.add_argument("-t", "--targets", help="Targets for active discovery (written to targets.txt)", nargs='+')
+    parser.add_argument("--discover", help="Run active discovery with at most this many candidates per target", type=int)
+    args = parser.parse_args()
+
+    if args.targets:
+        backends.LocalStorage(args.output).write_lines("targets.txt", args.targets)
+    discovery = {"max_candidates": args.discover} if args.discover else None
+    alerts = run_pipeline(args.input, args.output, discovery)
+    print(f"INFO: pipeline finished with {len(alerts)} alert(s), results stored in {args.output}")
@@ -33,6 +33,19 @@ resource "aws_s3_bucket_public_access_block" "block_access_policy" {
   restrict_public_buckets = true
 }
 
+# Parts of multipart uploads that were neither completed nor aborted (e.g. lambda timeout) are removed
+resource "aws_s3_bucket_lifecycle_configuration" "abort_incomplete_uploads" {
+  bucket = aws_s3_bucket.s3_bucket_targets.id
+  rule {
+    id     = "abort-incomplete-multipart-uploads"
+    status = "Enabled"
+    filter {}
+    abort_incomplete_multipart_upload {
+      days_after_initiation = 1
+    }
+  }
+}
+
 ########## ECS cluster creation ##########
 
 module "ecs_cluster" {
@@ -82,7 +95,8 @@ module "alerting_lambda" {
   lambda_root                = "lambdas/alerting_lambda.py"
   layers                     = [module.lambda_layer.lambda_layer_arn]
   lambda_environment_variables = {
-    DC_WEBHOOK_URL = var.dc_webhook_url
+    DC_WEBHOOK_URL    = var.dc_webhook_url
+    SAMPLING_PROFILER = var.sampling_profiler
   }
   policy_arns = [
     module.compare_lambda.default_iam_policy_arn
@@ -96,7 +110,8 @@ module "compare_lambda" {
   lambda_root = "lambdas/compare_lambda.py"
   layers      = [module.lambda_layer.lambda_layer_arn]
   lambda_environment_variables = {
-    DATA_S3 = aws_s3_bucket.s3_bucket_targets.bucket_domain_name
+    DATA_S3           = aws_s3_bucket.s3_bucket_targets.bucket_domain_name
+    SAMPLING_PROFILER = var.sampling_profiler
   }
   scheduler_name = "compare_lambda_scheduler"
   # Every 9 hours. Just schedule, expect check_if_alive to be finished in 30 mins.
@@ -115,7 +130,8 @@ module "check_if_alive_lambda" {
   timeout     = 480
   layers      = [module.lambda_layer.lambda_layer_arn]
   lambda_environment_variables = {
-    DATA_S3 = aws_s3_bucket.s3_bucket_targets.bucket_domain_name
+    DATA_S3           = aws_s3_bucket.s3_bucket_targets.bucket_domain_name
+    SAMPLING_PROFILER = var.sampling_profiler
   }
   scheduler_name = "check_if_alive_lambda_scheduler"
   # Every 8,5 hours. Just schedule, expect runtask to be finished in 30 mins.
@@ -125,6 +141,28 @@ module "check_if_alive_lambda" {
   ]
 }
 
+module "discovery_lambda" {
+  source      = "./modules/scheduler_payload_lamba/"
+  lambda_name = "discovery_lambda"
+  account_id  = data.aws_caller_identity.current.account_id
+  lambda_root = "lambdas/discovery_lambda.py"
+  timeout     = 900
+  layers      = [module.lambda_layer.lambda_layer_arn]
+  lambda_environment_variables = {
+    DATA_S3           = aws_s3_bucket.s3_bucket_targets.bucket_domain_name
+    SAMPLING_PROFILER = var.sampling_profiler
+  }
+  scheduler_name = "discovery_lambda_scheduler"
+  # After check_if_alive so permutations use the latest results, before compare runs on the next cycle.
+  cron_expression = "cron(45 */8 ? * * *)"
+  json_payload = jsonencode({
+    "max_candidates" : 200000
+  })
+  policy_arns = [
+    module.compare_lambda.default_iam_policy_arn
+  ]
+}
+
 module "ecs_runtask_lambda" {
   source      = "./modules/scheduler_payload_lamba/"
   lambda_name = "ecs_runtask_lambda"
@@ -137,6 +175,7 @@ module "ecs_runtask_lambda" {
     DEFAULT_SECURITY_GROUP  = data.aws_security_group.selected.id,
     DEFAULT_SUBNET          = data.aws_subnets.default.ids[0],
     DATA_S3                 = aws_s3_bucket.s3_bucket_targets.bucket_domain_name
+    SAMPLING_PROFILER       = var.sampling_profiler
   }
   scheduler_name  = "ecs_runtask_lambda_scheduler"
   cron_expression = "cron(0 */8 ? * * *)" # Every 8 hours, requires testing
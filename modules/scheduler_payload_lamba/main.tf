@@ -1,8 +1,10 @@
 ########## Lambda creation ##########
 
+# Packages the whole lambdas directory so handlers can import shared modules (backends.py)
 data "archive_file" "lambda_archive" {
   type        = "zip"
-  source_file = var.lambda_root
+  source_dir  = dirname(var.lambda_root)
+  excludes    = ["requirements.txt", "__pycache__"]
   output_path = "${path.module}/${var.lambda_name}.zip"
 }
 
@@ -51,6 +53,7 @@ resource "aws_iam_policy" "lambda_tooling_policy" {
         "Action" : [
           "s3:*Object",
           "s3:List*",
+          "s3:AbortMultipartUpload",
           "s3-object-lambda:*Object",
           "s3-object-lambda:List*"
         ],
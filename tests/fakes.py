@@ -0,0 +1,88 @@
+"""
+In-memory stand-ins for the AWS clients used by the backends.
+"""
+
+import io
+
+
+class FakeS3Client:
+    """
+    Keeps objects and multipart uploads in dicts. Uploading the part numbers
+    in fail_parts raises, like a part upload that ran out of retries.
+    """
+    class exceptions:
+        class NoSuchKey(Exception):
+            pass
+
+    def __init__(self, fail_parts=()):
+        self.objects = {}
+        self.uploads = {}
+        self.aborted = []
+        self.fail_parts = set(fail_parts)
+
+    def put_object(self, Bucket, Key, Body, **kwargs):
+        self.objects[Key] = Body.encode() if isinstance(Body, str) else Body
+
+    def get_object(self, Bucket, Key):
+        if Key not in self.objects:
+            raise self.exceptions.NoSuchKey(Key)
+        return {'Body': io.BytesIO(self.objects[Key])}
+
+    def get_paginator(self, operation_name):
+        return self
+
+    def paginate(self, Bucket, Prefix, Delimiter=None):
+        keys = sorted(key for key in self.objects if key.startswith(Prefix))
+        prefixes = sorted({key[:key.index(Delimiter, len(Prefix)) + 1] for key in keys if Delimiter and Delimiter in key[len(Prefix):]})
+        contents = [{'Key': key} for key in keys if not any(key.startswith(prefix) for prefix in prefixes)]
+        yield {'Contents': contents, 'CommonPrefixes': [{'Prefix': prefix} for prefix in prefixes]}
+
+    def create_multipart_upload(self, Bucket, Key, **kwargs):
+        upload_id = f"upload-{len(self.uploads) + 1}"
+        self.uploads[upload_id] = {'Key': Key, 'Parts': {}}
+        return {'UploadId': upload_id}
+
+    def upload_part(self, Bucket, Key, UploadId, PartNumber, Body):
+        if PartNumber in self.fail_parts:
+            raise ConnectionError(f"part {PartNumber} failed")
+        self.uploads[UploadId]['Parts'][PartNumber] = Body
+        return {'ETag': f"etag-{PartNumber}"}
+
+    def complete_multipart_upload(self, Bucket, Key, UploadId, MultipartUpload):
+        parts = self.uploads.pop(UploadId)['Parts']
+        self.objects[Key] = b"".join(parts[part['PartNumber']] for part in MultipartUpload['Parts'])
+
+    def abort_multipart_upload(self, Bucket, Key, UploadId):
+        self.uploads.pop(UploadId)
+        self.aborted.append(Key)
+
+
+class FakeLogsClient:
+    """
+    Serves the given event pages of every stream with paging tokens like the logs client.
+    Past the last page, no events and the token that was sent are returned.
+    """
+    def __init__(self, streams):
+        self.streams = streams
+
+    def describe_log_streams(self, **kwargs):
+        return {'logStreams': [{'logStreamName': name, 'lastEventTimestamp': timestamp} for name, (timestamp, _) in self.streams.items()]}
+
+    def get_log_events(self, logStreamName, nextToken=None, **kwargs):
+        pages = self.streams[logStreamName][1]
+        page = int(nextToken) if nextToken else 0
+        if page >= len(pages):
+            return {'events': [], 'nextForwardToken': nextToken}
+        return {'events': [{'message': message} for message in pages[page]], 'nextForwardToken': str(page + 1)}
+
+
+class FakeContext:
+    """
+    Lambda context whose time left is a number of ms, or a callable returning it
+    for time that runs out during the test.
+    """
+    def __init__(self, remaining_ms):
+        self.remaining_ms = remaining_ms
+
+    def get_remaining_time_in_millis(self):
+        return self.remaining_ms() if callable(self.remaining_ms) else self.remaining_ms
@@ -0,0 +1,150 @@
+import gzip
+import json
+import random
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+import pytest
+
+import backends
+from check_if_alive_lambda import ResultWriter, rebuild_daily_views
+from fakes import FakeLogsClient, FakeS3Client
+
+
+def random_lines(count):
+    rng = random.Random(1)
+    return [f"{rng.getrandbits(128):032x}.example.com" for _ in range(count)]
+
+
+@pytest.fixture
+def executor():
+    with ThreadPoolExecutor(max_workers=backends.UPLOAD_WORKERS) as executor:
+        yield executor
+
+
+def test_small_object_is_put_in_one_request(executor):
+    s3_client = FakeS3Client()
+    writer = backends.S3LineWriter(s3_client, "bucket", "small.txt.gz", executor)
+    writer.write("a.example.com")
+    writer.close()
+    assert not s3_client.uploads
+    assert gzip.decompress(s3_client.objects["small.txt.gz"]).decode().splitlines() == ["a.example.com"]
+
+
+def test_multipart_round_trip(executor):
+    s3_client = FakeS3Client()
+    lines = random_lines(5000)
+    writer = backends.S3LineWriter(s3_client, "bucket", "large.txt.gz", executor, part_size=4096)
+    for line in lines:
+        writer.write(line)
+    writer.close()
+    assert writer.parts and len(writer.parts) > backends.UPLOAD_WORKERS
+    assert not s3_client.uploads
+    assert gzip.decompress(s3_client.objects["large.txt.gz"]).decode().splitlines() == lines
+
+
+def test_failed_part_aborts_upload(executor):
+    s3_client = FakeS3Client(fail_parts={2})
+    writer = backends.S3LineWriter(s3_client, "bucket", "large.txt.gz", executor, part_size=4096)
+    with pytest.raises(ConnectionError):
+        for line in random_lines(5000):
+            writer.write(line)
+        writer.close()
+    assert s3_client.aborted == ["large.txt.gz"]
+    assert not s3_client.uploads
+    assert "large.txt.gz" not in s3_client.objects
+
+
+def test_failed_last_part_aborts_upload(executor):
+    s3_client = FakeS3Client(fail_parts={3})
+    writer = backends.S3LineWriter(s3_client, "bucket", "large.txt.gz", executor, part_size=4096)
+    lines = iter(random_lines(20000))
+    while len(writer.parts) < 2:
+        writer.write(next(lines))
+    with pytest.raises(ConnectionError):
+        writer.close()
+    assert s3_client.aborted == ["large.txt.gz"]
+    assert not s3_client.uploads
+
+
+class FakeStorage:
+    def __init__(self, s3_client, executor, part_sizes):
+        self.s3_client = s3_client
+        self.executor = executor
+        self.part_sizes = part_sizes
+
+    def open_writer(self, key):
+        return backends.S3LineWriter(self.s3_client, "bucket", key, self.executor, self.part_sizes.get(key, backends.PART_SIZE))
+
+
+def test_result_writer_keeps_other_objects_when_one_fails(executor):
+    s3_client = FakeS3Client(fail_parts={1})
+    failing_key = "results/a.com/2024-01-01/run/domains.txt.gz"
+    writer = ResultWriter(FakeStorage(s3_client, executor, {failing_key: 1024}), "2024-01-01", "run")
+    for i, line in enumerate(random_lines(6000)):
+        writer.write("a.com" if i % 2 else "b.com", line, f"10.0.{i // 256}.{i % 256}")
+    writer.close()
+    assert s3_client.aborted == [failing_key]
+    assert failing_key not in s3_client.objects
+    assert sorted(s3_client.objects) == [
+        "results/a.com/2024-01-01/run/ips.txt.gz",
+        "results/b.com/2024-01-01/run/domains.txt.gz",
+        "results/b.com/2024-01-01/run/ips.txt.gz",
+    ]
+
+
+@pytest.fixture(params=["s3", "local"])
+def storage(request, tmp_path):
+    if request.param == "s3":
+        return backends.S3Storage("bucket", FakeS3Client())
+    return backends.LocalStorage(str(tmp_path))
+
+
+def test_storage_streams_plain_and_gzip_objects(storage):
+    for key in ("plain.txt", "dir/compressed.txt.gz"):
+        writer = storage.open_writer(key)
+        for line in ("a.example.com", "b.example.com"):
+            writer.write(line)
+        writer.close()
+        assert list(storage.iter_lines(key)) == ["a.example.com", "b.example.com"]
+    assert list(storage.iter_lines("missing.txt")) == []
+
+
+def test_storage_lists_keys(storage):
+    for key in ("results/a.com/d1/r1/domains.txt.gz", "results/a.com/d2/r1/domains.txt.gz", "results/b.com/d1/r1/ips.txt.gz", "targets.txt"):
+        storage.write_lines(key, ["x"])
+    assert storage.list_keys("results/", delimiter="/") == ["results/a.com/", "results/b.com/"]
+    assert storage.list_keys("results/a.com/d1/") == ["results/a.com/d1/r1/domains.txt.gz"]
+
+
+def test_daily_views_are_rebuilt_from_partitions(storage):
+    runs = [
+        ("20240101T000000", 200, [("a.com", "www.a.com", "10.0.0.1"), ("b.com", "www.b.com", "10.0.0.2")]),
+        ("20240101T080000", 301, [("a.com", "www.a.com", "10.0.0.1"), ("a.com", "new.a.com", "10.0.0.3")]),
+        ("20240101T160000-discovery", 301, [("b.com", "dev.b.com", "10.0.0.2")]),
+    ]
+    # Written out of order, the daily view follows the run IDs
+    for run_id, status, results in reversed(runs):
+        writer = ResultWriter(storage, "2024-01-01", run_id)
+        for target, domain, ip in results:
+            writer.write(target, domain, ip, {"status": status})
+        writer.close()
+    writer = ResultWriter(storage, "2024-01-02", "20240102T000000")
+    writer.write("a.com", "other.a.com", "10.0.0.4")
+    writer.close()
+    rebuild_daily_views(storage, "2024-01-01")
+    assert set(storage.iter_lines("2024-01-01_domains.txt")) == {"www.a.com", "www.b.com", "new.a.com", "dev.b.com"}
+    assert set(storage.iter_lines("2024-01-01_ips.txt")) == {"10.0.0.1", "10.0.0.2", "10.0.0.3"}
+    fingerprints = [json.loads(line) for line in storage.iter_lines("2024-01-01_fingerprints.txt")]
+    # Runs are concatenated in order, so the latest fingerprint of a host comes last
+    assert {fingerprint["host"]: fingerprint["status"] for fingerprint in fingerprints}["www.a.com"] == 301
+
+
+def test_log_source_reads_past_empty_pages():
+    now = int(datetime.now().timestamp() * 1000)
+    logs_client = FakeLogsClient({
+        "subfinder/a": (now, [["a1", "a2"], [], ["a3"]]),
+        "subfinder/b": (now, [[], ["b1"]]),
+    })
+    messages = backends.CloudWatchLogSource(logs_client).iter_messages("/ecs/domain_enumerator")
+    assert sorted(messages) == ["a1", "a2", "a3", "b1"]
@@ -0,0 +1,38 @@
+import candidates
+
+
+def test_is_valid():
+    assert candidates.is_valid("www.example.com")
+    assert candidates.is_valid("a-b.example.com")
+    assert not candidates.is_valid("-www.example.com")
+    assert not candidates.is_valid("www-.example.com")
+    assert not candidates.is_valid("www..example.com")
+    assert not candidates.is_valid(f"{'a' * 64}.example.com")
+    assert not candidates.is_valid(".".join(["a" * 60] * 5))
+
+
+def test_number_variants():
+    assert list(candidates.number_variants("web")) == ["web1", "web2", "web3"]
+    assert list(candidates.number_variants("web2")) == ["web0", "web1", "web3", "web4", "web5"]
+    assert list(candidates.number_variants("app01")) == ["app00", "app02", "app03", "app04"]
+    assert "db1-eu2" in candidates.number_variants("db1-eu1")
+    assert "db2-eu1" in candidates.number_variants("db1-eu1")
+
+
+def test_generate_candidates_skips_known_and_duplicates():
+    known = {"web1.example.com", "web2.example.com", "www.other.com"}
+    names = list(candidates.generate_candidates("example.com", known, ["www", "api"]))
+    assert len(names) == len(set(names))
+    assert not known & set(names)
+    assert "www.example.com" in names and "web3.example.com" in names
+    assert not any(name.endswith("other.com") for name in names)
+
+
+def test_generate_candidates_limit():
+    known = {f"web{i}.example.com" for i in range(50)}
+    assert len(list(candidates.generate_candidates("example.com", known, candidates.DEFAULT_WORDS, 100))) == 100
+
+
+def test_unique_recent_is_bounded():
+    names = ["a", "b", "a", "c", "d", "a"]
+    assert list(candidates.unique_recent(names, window=2)) == ["a", "b", "c", "d", "a"]
@@ -0,0 +1,27 @@
+import json
+
+from requests.exceptions import InvalidURL
+
+import backends
+import check_if_alive_lambda
+
+
+def test_failing_host_does_not_lose_the_run(monkeypatch, tmp_path):
+    recorded = tmp_path / "subfinder.json"
+    recorded.write_text("".join(json.dumps({"host": f"host{i}.a.com", "input": "a.com"}) + "\n" for i in range(20)))
+
+    def check_if_alive(domain):
+        if domain == "host7.a.com":
+            raise InvalidURL(f"Invalid URL 'https://{domain}'")
+        return domain, "10.0.0.1", {"status": 200}
+
+    monkeypatch.setattr(check_if_alive_lambda, "check_if_alive", check_if_alive)
+    storage = backends.LocalStorage(str(tmp_path / "data"))
+    backends.configure(storage=storage, log_source=backends.NdjsonLogSource([str(recorded)]))
+    try:
+        check_if_alive_lambda.lambda_handler({}, None)
+    finally:
+        backends.configure()
+    daily = [key for key in storage.list_keys("") if key.endswith("_domains.txt")]
+    assert len(daily) == 1
+    assert sorted(storage.iter_lines(daily[0])) == sorted(f"host{i}.a.com" for i in range(20) if i != 7)
@@ -0,0 +1,102 @@
+import time
+
+import pytest
+
+import alerting_lambda
+import backends
+import check_if_alive_lambda
+import compare_lambda
+from check_if_alive_lambda import FINGERPRINT_VERSION, fingerprint, normalise_body
+
+
+@pytest.fixture
+def alerts():
+    alerts = []
+    backends.configure(alert_queue=backends.InProcessAlertQueue(alerts.append))
+    yield alerts
+    backends.configure()
+
+
+def host_fingerprint(**fields):
+    return {"version": FINGERPRINT_VERSION, "status": 200, "location": None, "server": "nginx", "title": "Home", "body_hash": "abc", **fields}
+
+
+def test_unchanged_fingerprints_raise_no_alert(alerts):
+    compare_lambda.compare_fingerprints({"a.com": host_fingerprint()}, {"a.com": host_fingerprint(), "new.a.com": host_fingerprint()})
+    assert alerts == []
+
+
+def test_changed_fingerprint_raises_alert(alerts):
+    compare_lambda.compare_fingerprints(
+        {"a.com": host_fingerprint(), "b.com": host_fingerprint()},
+        {"a.com": host_fingerprint(title="Login", body_hash="def"), "b.com": host_fingerprint()}
+    )
+    assert [alert["action"] for alert in alerts] == ["changed"]
+    assert alerts[0]["message"] == ["a.com (title: Home -> Login; body_hash: abc -> def)"]
+
+
+def test_fingerprints_of_other_versions_are_not_compared(alerts):
+    previous = host_fingerprint(body_hash="old")
+    del previous["version"]
+    compare_lambda.compare_fingerprints({"a.com": previous}, {"a.com": host_fingerprint()})
+    assert alerts == []
+
+
+def test_alerts_fit_in_discord_messages(alerts):
+    hosts = {f"host{i}.example.com": host_fingerprint() for i in range(200)}
+    changed = {host: host_fingerprint(title="x" * (150 + i)) for i, host in enumerate(hosts)}
+    changed["long.example.com"] = host_fingerprint(title="'\\" * 1000)
+    hosts["long.example.com"] = host_fingerprint()
+    compare_lambda.compare_fingerprints(hosts, changed)
+    compare_lambda.compare_domain_lists([], [f"new{i}.example.com" for i in range(500)])
+    assert len(alerts) > 2
+    assert all(len(alerting_lambda.format_alert(alert)) <= compare_lambda.ALERT_MAX_LENGTH for alert in alerts)
+    assert sum(len(alert["message"]) for alert in alerts if alert["action"] == "changed") == 201
+    assert sorted(host for alert in alerts if alert["action"] == "new" for host in alert["message"]) == sorted(f"new{i}.example.com" for i in range(500))
+
+
+def test_normalise_body_masks_tokens():
+    first = b'<input name="csrf" value="Zm9vYmFyYmF6cXV4MTIzNDU2Nzg5MA=="><script src="/app.3f2a9c1e8b7d6a5f.js"></script><p>12:03</p>'
+    second = b'<input name="csrf" value="cXV4YmF6Zm9vYmFyOTg3NjU0MzIxMA=="><script src="/app.9e8d7c6b5a4f3e2d.js"></script><p>18:47</p>'
+    assert normalise_body(first) == normalise_body(second)
+    assert b"navigation-container-dropdown" in normalise_body(b'<div class="navigation-container-dropdown">')
+
+
+class FakeResponse:
+    def __init__(self, body, status_code=200, headers=None):
+        self.body = body
+        self.status_code = status_code
+        self.headers = headers or {}
+
+    def iter_content(self, chunk_size):
+        for start in range(0, len(self.body), chunk_size):
+            yield self.body[start:start + chunk_size]
+
+    def close(self):
+        pass
+
+
+def test_fingerprint_ignores_per_request_state():
+    first = fingerprint(FakeResponse(b"<title>Login</title>token=a1b2c3d4e5f60718293a", 302, {"Location": "https://a.com/login?session=1234#x"}))
+    second = fingerprint(FakeResponse(b"<title>Login</title>token=ffeeddccbbaa99887766", 302, {"Location": "https://a.com/login?session=5678"}))
+    assert first == second
+    assert first["location"] == "https://a.com/login" and first["title"] == "Login"
+    assert fingerprint(FakeResponse(b"<title>Admin</title>")) != fingerprint(FakeResponse(b"<title>Login</title>"))
+
+
+class SlowResponse(FakeResponse):
+    """
+    Sends the body one byte at a time, like a server trickling it to keep connections open.
+    """
+    def iter_content(self, chunk_size):
+        for byte in self.body:
+            time.sleep(0.01)
+            yield bytes([byte])
+
+
+def test_fingerprint_stops_reading_slow_bodies(monkeypatch):
+    monkeypatch.setattr(check_if_alive_lambda, "FINGERPRINT_SECONDS", 0.2)
+    start = time.monotonic()
+    host_fingerprint = fingerprint(SlowResponse(b"<title>Slow</title>" + b"x" * 4096))
+    assert time.monotonic() - start < 1
+    assert host_fingerprint["title"] == "Slow"
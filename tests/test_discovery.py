@@ -0,0 +1,131 @@
+import gzip
+import itertools
+import threading
+
+from requests.exceptions import InvalidURL
+
+import backends
+import discovery_lambda
+from fakes import FakeContext
+
+
+def fake_resolver(records, wildcards):
+    def resolve_all_ips(name):
+        if name in records:
+            return records[name]
+        parent = name.split(".", 1)[1]
+        return wildcards.get(parent, [])
+    return resolve_all_ips
+
+
+def test_wildcard_answers_are_filtered(monkeypatch):
+    monkeypatch.setattr(discovery_lambda, "resolve_all_ips", fake_resolver(
+        {"www.a.com": ["10.0.0.1"], "api.a.com": ["10.0.0.2"], "www.b.com": ["10.0.1.1"], "dev.b.com": ["10.0.1.9"]},
+        {"b.com": ["10.0.1.1"]}
+    ))
+    found = discovery_lambda.discover(["a.com", "b.com"], set(), ["www", "api", "dev", "mail"])
+    assert found == {
+        "www.a.com": ("a.com", "10.0.0.1"),
+        "api.a.com": ("a.com", "10.0.0.2"),
+        "dev.b.com": ("b.com", "10.0.1.9"),
+    }
+
+
+def test_rotating_wildcard_answers_are_filtered(monkeypatch):
+    pool = ["10.0.2.1", "10.0.2.2", "10.0.2.3", "10.0.2.4"]
+    queries = itertools.count()
+    lock = threading.Lock()
+
+    # Every answer of the wildcard is one address of the pool, in turn
+    def resolve_all_ips(name):
+        if name == "www.c.com":
+            return ["10.0.3.1"]
+        with lock:
+            return [pool[next(queries) % len(pool)]]
+
+    monkeypatch.setattr(discovery_lambda, "resolve_all_ips", resolve_all_ips)
+    words = [f"word{i}" for i in range(1000)] + ["www"]
+    assert discovery_lambda.discover(["c.com"], set(), words) == {"www.c.com": ("c.com", "10.0.3.1")}
+
+
+def test_wildcard_answer_sets_are_compared(monkeypatch):
+    # Round robin DNS returns every address of the pool, rotated
+    def resolve_all_ips(name):
+        if name == "www.d.com":
+            return ["10.0.4.9", "10.0.4.8"]
+        shift = sum(map(ord, name)) % 3
+        return ["10.0.4.1", "10.0.4.2", "10.0.4.3"][shift:] + ["10.0.4.1", "10.0.4.2", "10.0.4.3"][:shift]
+
+    monkeypatch.setattr(discovery_lambda, "resolve_all_ips", resolve_all_ips)
+    found = discovery_lambda.discover(["d.com"], set(), ["www", "api", "dev", "mail"])
+    assert found == {"www.d.com": ("d.com", "10.0.4.9")}
+
+
+def test_map_bounded_stops_submitting():
+    submitted = []
+
+    def func(item):
+        submitted.append(item)
+        return item * 2
+
+    results = dict(discovery_lambda.map_bounded(func, itertools.count(), lambda: len(submitted) >= 10, workers=2, max_in_flight=4))
+    assert len(results) == len(submitted) < 20
+    assert all(results[item] == item * 2 for item in results)
+
+
+def test_probe_phase_stops_before_the_timeout(monkeypatch, tmp_path):
+    storage = backends.LocalStorage(str(tmp_path))
+    storage.write_lines("targets.txt", ["a.com"])
+    words = [f"host{i}" for i in range(100)]
+    storage.write_lines("wordlist.txt", words)
+    resolved_names = []
+
+    def resolve_all_ips(name):
+        resolved_names.append(name)
+        return ["10.0.0.1"] if name.startswith("host") else []
+
+    def probe(domain):
+        probed.append(domain)
+        return {"status": 200}
+
+    # Plenty of time while resolving, the time left drops below the upload reserve after 10 probes
+    def remaining_ms():
+        return 0 if len(probed) >= 10 else discovery_lambda.PROBE_RESERVE_MS * 2
+
+    probed = []
+    monkeypatch.setattr(discovery_lambda, "resolve_all_ips", resolve_all_ips)
+    monkeypatch.setattr(discovery_lambda, "probe", probe)
+    backends.configure(storage=storage)
+    try:
+        discovery_lambda.lambda_handler({"max_candidates": 100}, FakeContext(remaining_ms))
+    finally:
+        backends.configure()
+    domains = storage.list_keys("results/a.com/")
+    assert [key.rsplit("/", 1)[1] for key in domains] == ["domains.txt.gz", "fingerprints.txt.gz", "ips.txt.gz"]
+    with gzip.open(tmp_path / domains[0], "rt") as infile:
+        written = infile.read().splitlines()
+    assert sorted(written) == sorted(probed) and 10 <= len(written) < 100
+    assert sorted(storage.iter_lines(f"{domains[0].split('/')[2]}_domains.txt")) == sorted(written)
+    # Probed hosts are not resolved again
+    assert len(resolved_names) == len(set(resolved_names))
+
+
+def test_failing_probe_does_not_lose_the_run(monkeypatch, tmp_path):
+    storage = backends.LocalStorage(str(tmp_path))
+    storage.write_lines("targets.txt", ["a.com"])
+    storage.write_lines("wordlist.txt", [f"host{i}" for i in range(20)])
+
+    def probe(domain):
+        if domain == "host7.a.com":
+            raise InvalidURL(f"Invalid URL 'https://{domain}'")
+        return {"status": 200}
+
+    monkeypatch.setattr(discovery_lambda, "resolve_all_ips", lambda name: ["10.0.0.1"] if name.startswith("host") else [])
+    monkeypatch.setattr(discovery_lambda, "probe", probe)
+    backends.configure(storage=storage)
+    try:
+        discovery_lambda.lambda_handler({}, None)
+    finally:
+        backends.configure()
+    daily = [key for key in storage.list_keys("") if key.endswith("_domains.txt")]
+    assert sorted(storage.iter_lines(daily[0])) == sorted(f"host{i}.a.com" for i in range(20) if i != 7)
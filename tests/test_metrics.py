@@ -0,0 +1,22 @@
+import contextlib
+import io
+import json
+import time
+
+import metrics
+from fakes import FakeContext
+
+
+def test_complete_metrics_are_printed_after_the_timeout_flush(monkeypatch):
+    monkeypatch.setattr(metrics, "TIMEOUT_FLUSH_MARGIN", 0.0)
+    output = io.StringIO()
+    with contextlib.redirect_stdout(output):
+        with metrics.invocation("test_lambda", FakeContext(50)):
+            metrics.increment("probed", 3)
+            time.sleep(0.2)
+            metrics.increment("probed", 2)
+    partial, final = [json.loads(line) for line in output.getvalue().splitlines()]
+    assert partial["Flush"] == "timeout" and partial["timed_out"] == 1 and partial["probed"] == 3
+    assert partial["_aws"]["CloudWatchMetrics"][0]["Dimensions"] == [["FunctionName", "Flush"]]
+    assert final["probed"] == 5 and "timed_out" not in final
+    assert final["_aws"]["CloudWatchMetrics"][0]["Dimensions"] == [["FunctionName"]]
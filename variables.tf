@@ -13,3 +13,9 @@ variable "dc_webhook_url" {
   description = "Defines Discord webhook URL"
   type        = string
 }
+
+variable "sampling_profiler" {
+  description = "Fraction of lambda invocations run with the sampling profiler (0 disables, 1 profiles every invocation)"
+  type        = string
+  default     = "0"
+}